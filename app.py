@@ -2,12 +2,18 @@ import streamlit as st
 import sqlite3
 import pandas as pd
 import random
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from difflib import get_close_matches
-import requests
 import datetime
 from decimal import Decimal
+from precompute import create_scheduler
+from facets import FACET_COLUMNS
+from events import EventLog
+from cart_models import Cart, BillingInfo, cart_key, plain_product_id, session_footprint
+import checkout
+from throttle import RateLimiter, stats as throttle_stats
+from backend import BackendClient, CatalogService
+import os
+import uuid
 
 # Function to add background image
 def add_bg_image(image_url):
@@ -87,6 +93,7 @@ def create_user_table():
                             image_url TEXT,
                             FOREIGN KEY (username) REFERENCES users (username)
                         );''')
+        checkout.create_order_tables(conn)
     conn.close()
 
 # Add a new user to the database
@@ -124,27 +131,70 @@ def truncate(text, length):
     else:
         return text
 
-# Load merged data from CSV files
+# Catalog, search and recommendations, shared by all sessions. Built in this
+# process, or served by a shared backend when FASHION_BACKEND is set (see backend.py)
+@st.cache_resource
+def get_service():
+    if os.environ.get('FASHION_BACKEND'):
+        return BackendClient(os.environ['FASHION_BACKEND'])
+    return CatalogService(create_scheduler().start())
+
+# Interaction event log, shared by all sessions
+@st.cache_resource
+def get_event_log():
+    return EventLog().start()
+
+# Per-user limit on expensive actions, shared by all sessions
+@st.cache_resource
+def get_rate_limiter():
+    return RateLimiter()
+
+# Take a token for an expensive action, warning the user when they are going too fast
+def rate_limited(action):
+    limiter = get_rate_limiter()
+    if limiter.allow(st.session_state["username"], action):
+        return False
+    wait = max(1, round(limiter.retry_after(st.session_state["username"])))
+    st.warning(f"You're doing that too often. Please wait {wait}s and try again.")
+    return True
+
+# Load merged data (last finished build of the catalog)
 def load_data():
-    # Load data from CSV files
-    cleans_data = pd.read_csv('cleans_data.csv')
-    styles_data = pd.read_csv('styles.csv')
+    return get_service().catalog()
 
-    # Strip whitespace from column names
-    cleans_columns = ['ID', 'Product Id', 'Category', 'Name', 'Brand', 'Rating', 'ReviewCount', 'Description', 'ImageURL', 'Tags', 'Gender']
-    styles_columns = ['Product Id', 'baseColour', 'gender', 'masterCategory']
+# Rows of `data` for product ids returned by the service
+def rows_for_ids(data, product_ids):
+    product_indices = pd.Index(data['Product Id']).get_indexer(product_ids)
+    return data.iloc[product_indices[product_indices >= 0]]
 
-# Merge the datasets on 'Product Id'
-    merged_data = pd.merge(cleans_data[cleans_columns], styles_data[styles_columns], on='Product Id', how='inner')
+# Products whose name contains the query
+def search_products(data, query):
+    return rows_for_ids(data, get_service().search(query))
 
-    # Rename columns if necessary
-    merged_data.rename(columns={
-        'Product Brand': 'Brand',
-        'Product Rating': 'Rating',
-        'Product Image Url': 'ImageURL'
-    }, inplace=True)
+# Look up a product's catalog row by id (None if it is no longer in the catalog)
+def get_product(product_id):
+    return get_service().product(product_id)
 
-    return merged_data  # Return the merged DataFrame
+# Product name for carts and orders, which only store product ids
+def get_product_name(product_id):
+    product = get_product(product_id)
+    return product['Name'] if product is not None else f"Product {product_id}"
+
+# Session cart, created on first use
+def get_cart():
+    if 'cart' not in st.session_state:
+        st.session_state['cart'] = Cart()
+    return st.session_state['cart']
+
+# Display a product image, using the precomputed availability cache when possible
+def show_product_image(image_url, width):
+    if not (isinstance(image_url, str) and pd.notna(image_url)):
+        st.error("Invalid image URL")
+        return
+    if get_service().image_available(image_url):
+        st.image(image_url, width=width)
+    else:
+        st.error(f"Invalid image URL: {image_url}")
 
 # Function to get product ID by name
 def get_product_id_by_name(data, product_name):
@@ -158,32 +208,36 @@ def get_product_id_by_name(data, product_name):
         return None
 
 # Content-based recommendations
-def content_based_recommendations(data, product_id, top_n=5):
-    tfidf_vectorizer = TfidfVectorizer(stop_words='english')
-    data['Description'] = data['Description'].fillna('')  # Handle missing descriptions
-    tfidf_matrix = tfidf_vectorizer.fit_transform(data['Description'])
-    
-    cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
-    
-    indices = pd.Series(data.index, index=data['Product Id']).drop_duplicates()
-    idx = indices[product_id]
-
-    sim_scores = list(enumerate(cosine_sim[idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    sim_scores = sim_scores[1:top_n + 1]
-    product_indices = [i[0] for i in sim_scores]
+def content_based_recommendations(data, product_id, top_n=5, filters=None):
+    # Neighbors come from the precomputed TF-IDF table instead of a full similarity matrix;
+    # filters (e.g. {'Gender': 'Men'}) are applied while ranking, not afterwards
+    neighbor_ids = get_service().similar('tfidf', product_id, top_n, filters)
 
     # Update with correct column names
-    return data.iloc[product_indices][['Product Id', 'Name', 'Brand', 'baseColour', 'Gender', 'Rating', 'ImageURL']]
+    return rows_for_ids(data, neighbor_ids)[['Product Id', 'Name', 'Brand', 'baseColour', 'Gender', 'Rating', 'ImageURL']]
+
+# Embedding-based recommendations (same interface as content_based_recommendations)
+def embedding_recommendations(data, product_id, top_n=5, filters=None):
+    neighbor_ids = get_service().similar('embeddings', product_id, top_n, filters)
+    return rows_for_ids(data, neighbor_ids)[['Product Id', 'Name', 'Brand', 'baseColour', 'Gender', 'Rating', 'ImageURL']]
+
+# Available similarity models for "Find Similar Products"
+RECOMMENDERS = {
+    "Description keywords (TF-IDF)": content_based_recommendations,
+    "Semantic (embeddings)": embedding_recommendations,
+}
 
 # Add to cart function
 # Add to wishlist function
 def add_to_wishlist(product_id, product_name, image_url):
+    # Plain ints: sqlite would store numpy ids as blobs
+    product_id = plain_product_id(product_id)
     conn = create_connection()
     with conn:
         conn.execute('INSERT INTO wishlist (username, product_id, product_name, image_url) VALUES (?, ?, ?, ?)', 
                      (st.session_state["username"], product_id, product_name, image_url))
     conn.close()
+    get_event_log().log('wishlist_add', st.session_state["username"], product_id=product_id)
     st.success(f"{product_name} has been added to your wishlist!")
 
 # Signup function
@@ -219,13 +273,24 @@ def login():
         else:
             st.error("Invalid username or password.")
 
-def store_cart_in_db(username):
+def store_cart_in_db(username, known=None):
+    """Save the session cart. `known` maps product ids to (name, image URL) for products missing from the catalog."""
     conn = create_connection()
     with conn:
+        # Names and images already saved are kept for products the catalog no longer has
+        saved = {cart_key(product_id): (product_name, image_url) for product_id, product_name, _, image_url
+                 in conn.execute('SELECT product_id, product_name, price, image_url FROM cart WHERE username=?',
+                                 (username,))}
+        saved.update({cart_key(product_id): details for product_id, details in (known or {}).items()})
         conn.execute('DELETE FROM cart WHERE username=?', (username,))  # Clear existing items
-        for item in st.session_state['cart']:
+        for item in get_cart():
+            product = get_product(item.product_id)
+            if product is not None:
+                product_name, image_url = product['Name'], product['ImageURL']
+            else:
+                product_name, image_url = saved.get(item.product_id, (None, None))
             conn.execute('INSERT INTO cart (username, product_id, product_name, price, image_url) VALUES (?, ?, ?, ?, ?)', 
-                         (username, item['Product ID'], item['Product Name'], item['Price'], item['Image URL']))
+                         (username, item.product_id, product_name, item.price, image_url))
     conn.close()
 
 # Function to load cart from the database
@@ -233,7 +298,9 @@ def load_cart_from_db(username):
     conn = create_connection()
     with conn:
         cursor = conn.execute('SELECT product_id, product_name, price, image_url FROM cart WHERE username=?', (username,))
-        cart_items = cursor.fetchall()
+        # Rows saved from numpy ids hold 8-byte blobs; decode them before they reach the cart and orders
+        cart_items = [(plain_product_id(product_id), product_name, price, image_url)
+                      for product_id, product_name, price, image_url in cursor.fetchall()]
     conn.close()
     return cart_items
 def show_cart_page():
@@ -258,16 +325,13 @@ def show_cart_page():
                     # Display product details
                     st.image(image_url, width=150)
                     st.subheader(product_name)
-                    price = random.randint(150, 500)
                     st.write(f"Price: ₹{int(price)}")
                     # Calculate total price for the cart
                     total_price += price
 
                     # Button to remove item from cart
                     if st.button("Remove from Cart", key=f"remove_{product_id}"):
-                        with conn:
-                            conn.execute('DELETE FROM cart WHERE username=? AND product_id=?',
-                                         (st.session_state["username"], product_id))
+                        remove_from_cart(product_id)
                         st.success(f"Removed {product_name} from the cart.")
                           # Refresh to show updated cart
                         st.rerun()
@@ -277,14 +341,10 @@ def show_cart_page():
 
                 # Checkout button
                 if st.button("Proceed to Checkout"):
-                    # Remove all items from the cart after checkout
-                    with conn:
-                        conn.execute('DELETE FROM cart WHERE username=?', (st.session_state["username"],))
-                    
-                    # Optionally, save order details in another table (e.g., "orders")
-                    st.success("Proceeding to Checkout... Your cart has been cleared.")
+                    # The cart is cleared when the order is committed, not here
+                    st.success("Proceeding to Checkout...")
                     st.session_state['show_checkout_page'] = True  # Redirect to checkout
-                    st.rerun()  # Refresh the page to reflect cart clearance
+                    st.rerun()
             else:
                 st.write("Your cart is empty.")
         else:
@@ -302,27 +362,19 @@ def remove_from_cart(product_id):
     conn.close()
     
     # Update session state
-    st.session_state['cart'] = [item for item in st.session_state['cart'] if item['Product ID'] != product_id]
+    get_cart().remove(product_id)
 
 def update_cart_quantity(product_id):
     """Function to update the quantity in the cart."""
-    for item in st.session_state['cart']:
-        if item['Product ID'] == product_id:
-            item['Quantity'] = st.session_state[f'quantity_{product_id}']
-            break
+    get_cart().set_quantity(product_id, st.session_state[f'quantity_{product_id}'])
 
 # Add to cart function
 def add_to_cart(product_id, product_name, price, image_url):
-    if 'cart' not in st.session_state:
-        st.session_state['cart'] = []
-    st.session_state['cart'].append({
-        'Product ID': product_id,
-        'Product Name': product_name,
-        'Price': price,
-        'Image URL': image_url
-    })
+    product_id = plain_product_id(product_id)
+    get_cart().add(product_id, price)
     st.success(f"Added {product_name} to the cart!")
-    store_cart_in_db(st.session_state["username"]) 
+    store_cart_in_db(st.session_state["username"], {product_id: (product_name, image_url)})
+    get_event_log().log('cart_add', st.session_state["username"], product_id=product_id)
 
 # Function to display the Wishlist page
 def show_wishlist_page():
@@ -399,26 +451,31 @@ def show_checkout_page():
                     st.warning("Please fill out all fields before submitting.")
                 else:
                     # Save billing information to session state or database
-                    st.session_state["billing_info"] = {
-                        "full_name": full_name,
-                        "address": address,
-                        "city": city,
-                        "state": state,
-                        "zip_code": zip_code,
-                        "country": country,
-                        "phone": phone,
-                    }
+                    st.session_state["billing_info"] = BillingInfo(
+                        full_name=full_name,
+                        address=address,
+                        city=city,
+                        state=state,
+                        zip_code=zip_code,
+                        country=country,
+                        phone=phone,
+                    )
                     st.success("Billing information submitted successfully!")
         
         # Display the cart items for confirmation
         st.subheader("Your Cart Items")
-        if 'cart' in st.session_state and st.session_state['cart']:
+        cart = get_cart()
+        if not cart:
+            # e.g. a new session: check out what the user saved earlier
+            for product_id, _, price, _ in load_cart_from_db(st.session_state["username"]):
+                cart.add(product_id, price)
+        if cart:
+            # One key per checkout attempt, so a repeated submit can't place a second order
+            st.session_state.setdefault('checkout_key', uuid.uuid4().hex)
             total_price = 0  # Variable to keep track of total price
-            for item in st.session_state['cart']:
-                item['Price'] = random.randint(150, 500)
-                item_total = item['Price'] * item.get('Quantity', 1)
-                total_price += item_total
-                st.write(f"{item['Product Name']} - Price: ₹{int(item['Price']):} x {item.get('Quantity', 1)} = ₹{int(item_total):}")
+            for item in cart:
+                total_price += item.total
+                st.write(f"{get_product_name(item.product_id)} - Price: ₹{int(item.price):} x {item.quantity} = ₹{int(item.total):}")
 
             st.subheader(f"Total Amount: ₹{int(total_price):}")
 
@@ -442,30 +499,26 @@ def show_checkout_page():
                 else:
                     # Check again if the address fields are filled
                     billing_info = st.session_state['billing_info']
-                    if not all([billing_info['full_name'], billing_info['address'], billing_info['city'], 
-                                billing_info['state'], billing_info['zip_code'], billing_info['country'], 
-                                 billing_info['phone']]):
+                    if not billing_info.is_complete():
                         st.error("Please fill out the complete billing information before proceeding.")
                     else:
                         # Generate a random delivery date
                         delivery_date = generate_random_delivery_date()
 
-                        # Save order details (including delivery date)
-                        if 'orders' not in st.session_state:
-                            st.session_state['orders'] = []
-
-                        st.session_state['orders'].append({
-                            'order_id': generate_order_id(),  # Assume a function to generate unique order ID5
-                            'billing_info': st.session_state['billing_info'],
-                            'cart_items': st.session_state['cart'],
-                            'total_amount': total_price,
-                            'payment_method': payment_method,
-                            'delivery_date': delivery_date,
-                            'canceled': False
-                        })
+                        # Order, line items and clearing the saved cart commit together
+                        conn = checkout.connect()
+                        try:
+                            order_id, _ = checkout.place_order(
+                                conn, st.session_state["username"], cart, billing_info, payment_method,
+                                delivery_date, st.session_state['checkout_key'],
+                            )
+                        finally:
+                            conn.close()
 
                         # Clear the cart after purchase
-                        st.session_state['cart'] = []
+                        cart.clear()
+                        del st.session_state['checkout_key']
+                        st.session_state['last_order_id'] = order_id
 
                         # Reset the checkout state
                         st.session_state['show_checkout_page'] = False
@@ -486,10 +539,6 @@ def generate_random_delivery_date():
     random_days = random.randint(7, 14)
     return today + datetime.timedelta(days=random_days)
 
-def generate_order_id():
-    """Generate a unique order ID (for simplicity, using random numbers here)."""
-    return random.randint(100000, 999999)
-
 def show_order_summary():
     # Check if the order summary should be displayed
     if not st.session_state.get('order_confirmed', False):
@@ -500,22 +549,23 @@ def show_order_summary():
     add_custom_text_styles()
     st.title("🛒 Order Summary 🛒")
 
-    # Display billing information
-    if 'billing_info' in st.session_state:
-        billing_info = st.session_state['billing_info']
+    # Display the order that was just committed
+    conn = checkout.connect()
+    try:
+        orders = checkout.load_orders(conn, st.session_state["username"])
+    finally:
+        conn.close()
+    order = next((order for order in orders if order.order_id == st.session_state.get('last_order_id')), None)
+    if order is not None:
+        billing_info = order.billing_info
         st.subheader("Billing Information")
-        
-        # Generate and display an order ID
-        order_id = generate_order_id()
-        st.write(f"*Order ID:* {order_id}")
+        st.write(f"*Order ID:* {order.order_id}")
 
-        st.write(f"*Full Name:* {billing_info['full_name']}")
-        st.write(f"*Address:* {billing_info['address']}, {billing_info['city']}, {billing_info['state']}, {billing_info['zip_code']}, {billing_info['country']}")
-        st.write(f"*Phone Number:* {billing_info['phone']}")
+        st.write(f"*Full Name:* {billing_info.full_name}")
+        st.write(f"*Address:* {billing_info.address}, {billing_info.city}, {billing_info.state}, {billing_info.zip_code}, {billing_info.country}")
+        st.write(f"*Phone Number:* {billing_info.phone}")
 
-        # Generate delivery date and display
-        delivery_date = generate_random_delivery_date()
-        st.write(f"*Delivery Date:* {delivery_date.strftime('%Y-%m-%d')}")
+        st.write(f"*Delivery Date:* {order.delivery_date.strftime('%Y-%m-%d')}")
 
     # Optionally add a button to allow users to return to the main page or continue shopping
     if st.button("Continue Shopping"):
@@ -532,9 +582,13 @@ def show_my_orders():
         st.warning("Please log in to view your orders.")
         return
 
-# Check if the user has any orders
-    if 'orders' not in st.session_state or not st.session_state['orders']:
-        
+    # Check if the user has any orders
+    conn = checkout.connect()
+    try:
+        orders = checkout.load_orders(conn, st.session_state["username"])
+    finally:
+        conn.close()
+    if not orders:
         st.subheader("You have no past orders.")
         return
     add_bg_image("https://t3.ftcdn.net/jpg/03/59/68/80/360_F_359688056_TjlQsvMEyfNxQfsXc5D3HFXwttrfPOEi.jpg")
@@ -542,29 +596,34 @@ def show_my_orders():
     st.title("🛍 My Orders 🛍")
 
     # Display each order
-    for order_idx, order in enumerate(st.session_state['orders']):
-        st.subheader(f"Order ID: {order['order_id']}")
+    for order in orders:
+        st.subheader(f"Order ID: {order.order_id}")
         st.write(f"*Billing Information:*")
-        st.write(f"Full Name: {order['billing_info']['full_name']}")
-        st.write(f"Address: {order['billing_info']['address']}, {order['billing_info']['city']}, {order['billing_info']['state']}, {order['billing_info']['zip_code']}, {order['billing_info']['country']}")
-        st.write(f"Phone: {order['billing_info']['phone']}")
+        st.write(f"Full Name: {order.billing_info.full_name}")
+        st.write(f"Address: {order.billing_info.address}, {order.billing_info.city}, {order.billing_info.state}, {order.billing_info.zip_code}, {order.billing_info.country}")
+        st.write(f"Phone: {order.billing_info.phone}")
 
         st.write("*Items Ordered:*")
-        for item in order['cart_items']:
-            st.write(f"{item['Product Name']} - Price: ₹{item['Price']:} x {item.get('Quantity', 1)}")
+        for line in order.lines:
+            st.write(f"{get_product_name(line.product_id)} - Price: ₹{line.price:} x {line.quantity}")
 
         # Display total amount
-        st.write(f"*Total Amount:* ₹{order['total_amount']:}")
+        st.write(f"*Total Amount:* ₹{order.total_amount:}")
 
         # Display delivery date
-        delivery_date = order.get('delivery_date', generate_random_delivery_date())
-        st.write(f"*Delivery Date:* {delivery_date.strftime('%Y-%m-%d')}")
+        st.write(f"*Delivery Date:* {order.delivery_date.strftime('%Y-%m-%d')}")
 
         # Add "Cancel Order" button if the order hasn't been canceled already
-        if not order.get('canceled', False):
-            if st.button(f"Cancel Order {order['order_id']}", key=f"cancel_order_{order_idx}"):
-                st.session_state['orders'][order_idx]['canceled'] = True  # Mark order as canceled
-                st.success(f"Order {order['order_id']} has been canceled.")
+        if not order.canceled:
+            if st.button(f"Cancel Order {order.order_id}", key=f"cancel_order_{order.order_id}"):
+                # st.rerun() stops the script here, so the connection is closed before it
+                conn = checkout.connect()
+                try:
+                    checkout.cancel_order(conn, st.session_state["username"], order.order_id)
+                finally:
+                    conn.close()
+                get_event_log().log('order_cancel', st.session_state["username"], order_id=order.order_id)
+                st.success(f"Order {order.order_id} has been canceled.")
                 st.rerun()  # Refresh the page to reflect changes
         else:
             st.write(f"*Status:* Order Canceled")
@@ -577,6 +636,19 @@ def show_account_page():
     st.title("👤 Your Account 👤")
     
     st.write(f"Username: {st.session_state['username']}")
+
+    # Background build status of the catalog artifacts
+    service_stats = get_service().stats()
+    with st.expander("Catalog build status"):
+        st.table(pd.DataFrame(service_stats['artifacts']))
+
+    # Expensive requests refused or shared with an identical one in flight
+    with st.expander("Request coalescing and rate limits"):
+        st.table(pd.DataFrame(throttle_stats(service_stats['requests'], get_rate_limiter().counts)))
+
+    # Memory held by this session's cart and orders
+    with st.expander("Session memory"):
+        st.write({key: f"{size:,} bytes" for key, size in session_footprint(st.session_state).items()})
     
     # Delete Account Button
     if st.button("Delete Account"):
@@ -758,13 +830,13 @@ elif option == "Signup":
 # Trending Products Page
 elif option == "Trending Products":
     if st.session_state["logged_in"]:
-        merged_data = load_data()  # Load the merged data
+        trending_products = get_service().trending_pool()  # Precomputed trending pool
         add_bg_image("https://t3.ftcdn.net/jpg/03/59/68/80/360_F_359688056_TjlQsvMEyfNxQfsXc5D3HFXwttrfPOEi.jpg")
         add_custom_text_styles()
         st.title("🛒 Trending Products 😎")
 
-        # Randomly select 8 products without fixed random_state
-        random_products = merged_data.sample(n=8)  # No random_state for new selection every time
+        # Randomly select 8 of the top trending products without fixed random_state
+        random_products = trending_products.sample(n=min(8, len(trending_products)))  # No random_state for new selection every time
 
         cols_per_row = 4  # Number of columns in the grid
         for row_index in range(0, len(random_products), cols_per_row):
@@ -773,19 +845,7 @@ elif option == "Trending Products":
                 if row_index + col_index < len(random_products):
                     product = random_products.iloc[row_index + col_index]
                     with col:
-                        # Ensure the image URL is valid
-                        if isinstance(product['ImageURL'], str) and pd.notna(product['ImageURL']):
-                            # Check if the URL is accessible
-                            try:
-                                response = requests.head(product['ImageURL'])
-                                if response.status_code == 200:
-                                    st.image(product['ImageURL'], width=150)
-                                else:
-                                    st.error(f"Invalid image URL: {product['ImageURL']}")
-                            except Exception as e:
-                                   st.error(f"Failed to load image: {e}")
-                        else:
-                             st.error("Invalid image URL")  
+                        show_product_image(product['ImageURL'], width=150)
 
                         st.subheader(product['Name'])
                         st.write(f"Rating: {product['Rating']}")
@@ -810,9 +870,10 @@ elif option == "Recommendations":
         merged_data = load_data()
         product_name = st.text_input("Enter a product name or category (e.g., 'shirts'):") 
 
-        if st.button("Get Recommendations"):
+        if st.button("Get Recommendations") and not rate_limited('search'):
             # Filter the merged data for the specified product name
-            filtered_products = merged_data[merged_data['Name'].str.contains(product_name, case=False, na=False)]
+            filtered_products = search_products(merged_data, product_name)
+            get_event_log().log('search', st.session_state["username"], query=product_name, results=len(filtered_products))
 
             if not filtered_products.empty:
                 # Shuffle the filtered products and select a random sample
@@ -826,17 +887,7 @@ elif option == "Recommendations":
                 st.write("Top Recommendations:")
                 for i, rec in recommendations.iterrows():
                     image_url = rec['ImageURL']
-                    if isinstance(image_url, str) and pd.notna(image_url):
-                        try:
-                            response = requests.head(image_url)
-                            if response.status_code == 200:
-                                st.image(image_url, width=250)
-                            else:
-                                st.error(f"Invalid image URL: {image_url}")
-                        except Exception as e:
-                              st.error(f"Failed to load image: {e}")
-                    else:
-                        st.error("Invalid image URL")  
+                    show_product_image(image_url, width=250)
 
                     st.subheader(rec['Name'])
                     st.write(f"Rating: {rec['Rating']}")
@@ -851,6 +902,40 @@ elif option == "Recommendations":
                                on_click=add_to_wishlist, args=(rec['Product Id'], rec['Name'], image_url))
             else:
                 st.error("No products found for the given category or name.")
+
+        # Products similar to a given product
+        st.subheader("Find Similar Products")
+        similar_to = st.text_input("Enter a Product Id (e.g., '15970'):")
+        model = st.radio("Similarity model:", list(RECOMMENDERS), horizontal=True)
+
+        # Optional attribute filters
+        facet_values = get_service().facet_values()
+        filter_labels = {'Gender': "Gender", 'baseColour': "Base Colour", 'masterCategory': "Category"}
+        filters = {}
+        for col, column in zip(st.columns(len(FACET_COLUMNS)), FACET_COLUMNS):
+            with col:
+                value = st.selectbox(filter_labels[column], ["Any"] + facet_values[column], key=f"filter_{column}")
+            if value != "Any":
+                filters[column] = value
+
+        if st.button("Find Similar") and not rate_limited('recommendations'):
+            if similar_to.strip().isdigit() and int(similar_to) in set(merged_data['Product Id']):
+                try:
+                    similar_products = RECOMMENDERS[model](merged_data, int(similar_to), filters=filters)
+                except KeyError:
+                    # The similarity indexes are updated after the catalog, so a new product can be missing briefly
+                    st.info("That product is not indexed yet. Please try again in a minute.")
+                    similar_products = None
+                if similar_products is not None and similar_products.empty:
+                    st.write("No similar products match the selected filters.")
+                for i, rec in (similar_products.iterrows() if similar_products is not None else ()):
+                    show_product_image(rec['ImageURL'], width=150)
+                    st.subheader(rec['Name'])
+                    st.write(f"Brand: {rec['Brand']}")
+                    st.write(f"Base Colour: {rec['baseColour']}")
+                    st.write(f"Gender: {rec['Gender']}")
+            else:
+                st.error("No product found with that Product Id.")
     else:
         st.warning("You need to log in to view recommendations.")
 
@@ -0,0 +1,454 @@
+"""Catalog, search and recommendation service, optionally shared by several front-ends.
+
+By default app.py runs a CatalogService in its own process. To serve more
+users on one machine, run one backend that owns the catalog, the TF-IDF
+and embedding indexes and the image cache, and start several Streamlit
+front-ends that call it:
+
+    python backend.py serve --address /tmp/fashion.sock --workers 4
+    FASHION_BACKEND=/tmp/fashion.sock streamlit run app.py --server.port 8501
+    FASHION_BACKEND=/tmp/fashion.sock streamlit run app.py --server.port 8502
+
+Put a reverse proxy with sticky sessions in front of the front-end ports:
+session state and the per-user rate limits stay in the front-end a user
+is pinned to. Each front-end keeps a copy of the catalog for display and
+fetches it again only when the backend publishes a new version.
+
+The address is a Unix socket path or host:port. Requests are pickled, so
+a TCP address needs FASHION_BACKEND_KEY set to the same secret for the
+backend and the front-ends; it is optional for a Unix socket, whose file
+permissions already limit who can connect.
+
+The backend process runs the PrecomputeScheduler. With --workers N it
+forks N worker processes that answer requests from a read-only Snapshot
+of the artifacts, shared with the parent copy-on-write (the embedding
+matrix is memory-mapped, so it is shared through the page cache). When an
+artifact is rebuilt, new workers are forked from the new snapshot and the
+old ones are stopped; a request cut off by that is retried once by the
+client. Forking needs Linux or macOS; use --workers 1 elsewhere.
+
+    python backend.py bench --workers 1 2 4 --clients 8
+
+measures backend throughput for each worker count.
+"""
+import argparse
+import os
+import pickle
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import pandas as pd
+
+from facets import FACET_COLUMNS
+from precompute import build_catalog_index, check_image_url, create_scheduler, tfidf_similar
+from throttle import SingleFlight
+
+# Artifacts a worker can't answer requests without
+CORE_ARTIFACTS = ('catalog', 'catalog_by_id', 'tfidf', 'embeddings', 'trending')
+SUPERVISE_INTERVAL = 2.0  # Seconds between checks for new artifact versions and dead workers
+IMAGE_CHECK_TTL = 15 * 60  # Seconds an on-demand image check is reused, like the background image cache
+IMAGE_CHECKS_KEPT = 10000  # On-demand image checks remembered before the oldest are dropped
+
+
+def parse_address(address):
+    """('host', port) for 'host:port', otherwise a Unix socket path."""
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def _authkey(address):
+    key = os.environ.get('FASHION_BACKEND_KEY')
+    if key:
+        return key.encode()
+    if isinstance(address, tuple):
+        raise ValueError("Set FASHION_BACKEND_KEY to use a TCP backend address")
+    return None
+
+
+def _filters_key(filters):
+    """Hashable, order-independent form of a filters dict whose values may be lists or arrays of values."""
+    return tuple(sorted(
+        (column, value if isinstance(value, str) or not hasattr(value, '__iter__')
+         else tuple(sorted(str(item) for item in value)))
+        for column, value in filters.items()
+    ))
+
+
+class CatalogService:
+    """Read access to the scheduler artifacts used by the pages.
+
+    `source` is a PrecomputeScheduler or a Snapshot of one. Concurrent
+    identical requests share one computation.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.single_flight = SingleFlight()
+        self._image_checks = OrderedDict()  # url -> (checked at, available), oldest first
+        self._image_checks_lock = threading.Lock()
+
+    def versions(self):
+        return self.source.versions()
+
+    def catalog(self):
+        return self.single_flight.do('load_data', None, self.source.get, 'catalog')
+
+    def versioned_catalog(self):
+        """(catalog version, catalog), so clients can tell when their copy is stale."""
+        version = self.versions().get('catalog')
+        return version, self.catalog()
+
+    def product(self, product_id):
+        """A product's catalog row, or None if it is no longer in the catalog."""
+        catalog_by_id = self.source.get('catalog_by_id')
+        product_id = str(product_id)
+        if product_id in catalog_by_id.index:
+            return catalog_by_id.loc[product_id]
+        return None
+
+    def trending_pool(self):
+        return self.source.get('trending')['pool']
+
+    def facet_values(self):
+        facets = self.source.get('tfidf')['facets']
+        return {column: facets.values(column) for column in FACET_COLUMNS}
+
+    def search(self, query):
+        """Ids of the products whose name contains `query`, in catalog order."""
+        query = query.strip()
+        key = (self.versions().get('catalog'), query.lower())
+        return self.single_flight.do('search', key, self._search, query)
+
+    def _search(self, query):
+        catalog = self.catalog()
+        return catalog.loc[catalog['Name'].str.contains(query, case=False, na=False), 'Product Id'].to_numpy()
+
+    def similar(self, model, product_id, top_n=5, filters=None):
+        """Ids of the `top_n` products most similar to `product_id` under `model` ('tfidf' or 'embeddings').
+
+        `filters` restricts results by attribute, e.g. {'Gender': 'Men'}.
+        """
+        filters = filters or {}
+        key = (model, self.versions().get(model), product_id, top_n, _filters_key(filters))
+        return self.single_flight.do('recommendations', key, self._similar, model, product_id, top_n, filters)
+
+    def _similar(self, model, product_id, top_n, filters):
+        if model == 'tfidf':
+            tfidf = self.source.get('tfidf')
+            position = pd.Index(tfidf['product_ids']).get_indexer([product_id])[0]
+            if position < 0:
+                raise KeyError(product_id)
+            return tfidf['product_ids'][tfidf_similar(tfidf, position, top_n, filters)]
+        if model == 'embeddings':
+            neighbor_ids, _ = self.source.get('embeddings').similar_to(product_id, top_n, filters)
+            return neighbor_ids
+        raise ValueError(f"Unknown similarity model {model!r}")
+
+    def image_available(self, image_url):
+        """Whether an image URL loads, from the background cache or checked now.
+
+        Images outside the background cache are checked once and the result
+        is reused for IMAGE_CHECK_TTL seconds.
+        """
+        image_cache = self.source.get('image_cache', wait=False) or {}
+        available = image_cache.get(image_url)
+        if available is not None:
+            return available
+
+        now = time.monotonic()
+        with self._image_checks_lock:
+            checked = self._image_checks.get(image_url)
+        if checked is not None and now - checked[0] < IMAGE_CHECK_TTL:
+            return checked[1]
+
+        available = self.single_flight.do('image_check', image_url, check_image_url, image_url)
+        with self._image_checks_lock:
+            self._image_checks.pop(image_url, None)
+            self._image_checks[image_url] = (now, available)
+            while len(self._image_checks) > IMAGE_CHECKS_KEPT:
+                self._image_checks.popitem(last=False)
+        return available
+
+    def stats(self):
+        """Artifact build status and request coalescing counters."""
+        return {
+            'artifacts': self.source.stats(),
+            'requests': {name: dict(counts) for name, counts in self.single_flight.counts.items()},
+        }
+
+
+# Methods a client may call
+EXPOSED = ('versions', 'versioned_catalog', 'product', 'trending_pool', 'facet_values', 'search', 'similar',
+           'image_available', 'stats')
+
+
+class BackendClient:
+    """CatalogService interface served by a backend process.
+
+    Connections are pooled and each call borrows one, so the client can be
+    shared by all sessions of a front-end.
+    """
+
+    def __init__(self, address):
+        self.address = parse_address(address)
+        self.authkey = _authkey(self.address)
+        self._idle = queue.SimpleQueue()
+        self._catalog_lock = threading.Lock()
+        self._catalog = None  # (version, catalog, catalog_by_id)
+
+    def _connect(self):
+        return Client(self.address, authkey=self.authkey)
+
+    def call(self, method, *args, **kwargs):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            conn.send((method, args, kwargs))
+            status, value = conn.recv()
+        except (EOFError, OSError):
+            # The worker went away (e.g. replaced after a rebuild); retry once on a new connection
+            conn.close()
+            conn = self._connect()
+            conn.send((method, args, kwargs))
+            status, value = conn.recv()
+        self._idle.put(conn)
+        if status == 'error':
+            raise value
+        return value
+
+    def _catalog_copy(self):
+        version = self.call('versions').get('catalog')
+        with self._catalog_lock:
+            if self._catalog is None or self._catalog[0] != version:
+                version, catalog = self.call('versioned_catalog')
+                self._catalog = (version, catalog, build_catalog_index(catalog))
+            return self._catalog
+
+    def versions(self):
+        return self.call('versions')
+
+    def catalog(self):
+        return self._catalog_copy()[1]
+
+    def product(self, product_id):
+        catalog_by_id = self._catalog_copy()[2]
+        product_id = str(product_id)
+        if product_id in catalog_by_id.index:
+            return catalog_by_id.loc[product_id]
+        return None
+
+    def trending_pool(self):
+        return self.call('trending_pool')
+
+    def facet_values(self):
+        return self.call('facet_values')
+
+    def search(self, query):
+        return self.call('search', query)
+
+    def similar(self, model, product_id, top_n=5, filters=None):
+        return self.call('similar', model, product_id, top_n, filters)
+
+    def image_available(self, image_url):
+        return self.call('image_available', image_url)
+
+    def stats(self):
+        return self.call('stats')
+
+
+def _handle(service, conn):
+    with conn:
+        while True:
+            try:
+                method, args, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if method not in EXPOSED:
+                    raise AttributeError(f"Unknown backend method {method!r}")
+                reply = ('ok', getattr(service, method)(*args, **kwargs))
+            except Exception as error:
+                reply = ('error', error)
+            try:
+                conn.send(reply)
+            except (pickle.PicklingError, TypeError, AttributeError) as error:
+                conn.send(('error', RuntimeError(f"Unpicklable reply to {method!r}: {error!r}")))
+            except OSError:
+                return
+
+
+def _accept_loop(listener, service):
+    while True:
+        try:
+            conn = listener.accept()
+        except AuthenticationError:
+            continue
+        except OSError:
+            return  # Listener closed
+        threading.Thread(target=_handle, args=(service, conn), daemon=True).start()
+
+
+def _fork_worker(listener, snapshot):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            _accept_loop(listener, CatalogService(snapshot))
+        finally:
+            os._exit(0)
+    return pid
+
+
+def _stop_workers(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+
+def serve(address, workers=1, poll_interval=2.0):
+    """Answer CatalogService calls on `address` until interrupted."""
+    address = parse_address(address)
+    scheduler = create_scheduler(poll_interval).start()
+    listener = Listener(address, authkey=_authkey(address))
+    # Exit through the finally blocks below on SIGTERM, so the socket and workers are cleaned up
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Backend listening on {address} with {workers} worker(s)", flush=True)
+    if workers <= 1:
+        # Threads in this process, reading the live scheduler
+        try:
+            _accept_loop(listener, CatalogService(scheduler))
+        finally:
+            listener.close()
+        return
+
+    for name in CORE_ARTIFACTS:
+        scheduler.get(name)
+    snapshot = scheduler.snapshot()
+    pids = {_fork_worker(listener, snapshot) for _ in range(workers)}
+    try:
+        while True:
+            time.sleep(SUPERVISE_INTERVAL)
+            if scheduler.versions() != snapshot.versions():
+                # Fork workers on the new artifacts before stopping the old ones
+                snapshot = scheduler.snapshot()
+                old, pids = pids, {_fork_worker(listener, snapshot) for _ in range(workers)}
+                _stop_workers(old)
+            # Replace workers that died
+            while True:
+                try:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                if pid in pids:
+                    pids.discard(pid)
+                    pids.add(_fork_worker(listener, snapshot))
+    finally:
+        _stop_workers(pids)
+        listener.close()
+        scheduler.stop()
+
+
+def _bench_client(address, seconds, seed):
+    import random
+
+    client = BackendClient(address)
+    catalog = client.catalog()
+    product_ids = catalog['Product Id'].tolist()
+    words = catalog['Name'].dropna().str.split().explode().str.lower().unique().tolist()
+    genders = client.facet_values()['Gender']
+    rng = random.Random(seed)
+
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        kind = rng.random()
+        if kind < 0.4:
+            client.search(rng.choice(words))
+        elif kind < 0.7:
+            client.similar('tfidf', rng.choice(product_ids), 5)
+        elif kind < 0.9:
+            client.similar('embeddings', rng.choice(product_ids), 5, {'Gender': rng.choice(genders)})
+        else:
+            client.versions()
+        done += 1
+    return done
+
+
+def bench(worker_counts, clients, seconds, address):
+    """Requests per second served with each number of backend workers."""
+    import subprocess
+    from concurrent.futures import ProcessPoolExecutor
+
+    print(f"{os.cpu_count()} CPUs; clients run on the same machine", flush=True)
+    results = []
+    for workers in worker_counts:
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', '--address', address,
+                                   '--workers', str(workers)])
+        try:
+            # Wait until the workers answer and no artifact is still being built
+            while True:
+                try:
+                    if set(CORE_ARTIFACTS) <= set(BackendClient(address).versions()):
+                        break
+                except (OSError, EOFError):
+                    if server.poll() is not None:
+                        raise RuntimeError(f"Backend exited with code {server.returncode}")
+                time.sleep(0.5)
+            with ProcessPoolExecutor(clients) as pool:
+                # Each client counts requests over the same `seconds`, after its own setup
+                done = sum(pool.map(_bench_client, [address] * clients, [seconds] * clients, range(clients)))
+        finally:
+            server.terminate()
+            server.wait()
+        results.append((workers, done / seconds))
+        print(f"{workers} worker(s), {clients} clients: {done / seconds:,.0f} requests/s", flush=True)
+
+    base = results[0][1]
+    for workers, throughput in results:
+        print(f"  {workers:>2} worker(s): {throughput / base:.2f}x")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared catalog, search and recommendation backend.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="Run the backend")
+    serve_parser.add_argument('--address', default='/tmp/fashion.sock', help="Unix socket path or host:port")
+    serve_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    bench_parser = commands.add_parser('bench', help="Measure throughput by worker count")
+    bench_parser.add_argument('--address', default='/tmp/fashion-bench.sock')
+    bench_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    bench_parser.add_argument('--clients', type=int, default=8, help="Concurrent client processes")
+    bench_parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            serve(args.address, args.workers)
+        except KeyboardInterrupt:
+            pass
+    else:
+        bench(args.workers, args.clients, args.seconds, args.address)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Compact cart and order records kept in each user's session state.
+
+Cart items only hold the product id, quantity and unit price. Display fields
+such as the product name and image are looked up in the shared catalog when
+a page is rendered, so every session doesn't carry its own copy.
+"""
+import numbers
+import sys
+from dataclasses import dataclass, fields
+
+
+def plain_product_id(product_id):
+    """A product id as a plain int where it is numeric, otherwise as a string.
+
+    sqlite stores numpy int64 ids as 8-byte little-endian blobs; those are
+    decoded back to the number.
+    """
+    if isinstance(product_id, bytes) and len(product_id) == 8:
+        return int.from_bytes(product_id, 'little', signed=True)
+    if isinstance(product_id, numbers.Integral):
+        return int(product_id)
+    product_id = str(product_id).strip()
+    return int(product_id) if product_id.lstrip('-').isdigit() else product_id
+
+
+def cart_key(product_id):
+    return str(plain_product_id(product_id))
+
+
+@dataclass(slots=True)
+class CartItem:
+    product_id: str
+    price: float
+    quantity: int = 1
+
+    @property
+    def total(self):
+        return self.price * self.quantity
+
+
+class Cart:
+    """Cart items keyed by product id for O(1) lookups, updates and removals."""
+
+    __slots__ = ('items',)
+
+    def __init__(self):
+        self.items = {}
+
+    def add(self, product_id, price, quantity=1):
+        product_id = cart_key(product_id)
+        item = self.items.get(product_id)
+        if item is None:
+            self.items[product_id] = CartItem(product_id, price, quantity)
+        else:
+            item.quantity += quantity
+
+    def remove(self, product_id):
+        self.items.pop(cart_key(product_id), None)
+
+    def set_quantity(self, product_id, quantity):
+        item = self.items.get(cart_key(product_id))
+        if item is not None:
+            item.quantity = quantity
+
+    def clear(self):
+        self.items.clear()
+
+    def total(self):
+        return sum(item.total for item in self.items.values())
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, product_id):
+        return cart_key(product_id) in self.items
+
+
+@dataclass(slots=True)
+class BillingInfo:
+    full_name: str
+    address: str
+    city: str
+    state: str
+    zip_code: str
+    country: str
+    phone: str
+
+    def is_complete(self):
+        return all(getattr(self, f.name) for f in fields(self))
+
+
+@dataclass(slots=True, frozen=True)
+class OrderLine:
+    product_id: str
+    price: float
+    quantity: int
+
+    @property
+    def total(self):
+        return self.price * self.quantity
+
+
+@dataclass(slots=True)
+class Order:
+    order_id: int
+    billing_info: BillingInfo
+    lines: tuple
+    total_amount: float
+    payment_method: str
+    delivery_date: object
+    canceled: bool = False
+
+    @classmethod
+    def from_cart(cls, order_id, cart, billing_info, payment_method, delivery_date):
+        lines = tuple(OrderLine(item.product_id, item.price, item.quantity) for item in cart)
+        return cls(order_id, billing_info, lines, sum(line.total for line in lines),
+                   payment_method, delivery_date)
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate memory held by an object graph, counting shared objects once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, '__slots__'):
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(obj, name):
+                    size += deep_sizeof(getattr(obj, name), seen)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def session_footprint(session_state, keys=('cart', 'billing_info')):
+    """Bytes held by the cart and billing entries of one session."""
+    seen = set()
+    return {key: deep_sizeof(session_state[key], seen) for key in keys if key in session_state}
+
+
+if __name__ == '__main__':
+    # Compare the old dict-based session records with the slotted models
+    import datetime
+    import random
+
+    n_items, n_orders = 20, 10
+    product_ids = [str(random.randint(10000, 60000)) for _ in range(n_items)]
+    billing = {'full_name': 'A Customer', 'address': '1 Main Road', 'city': 'Pune', 'state': 'MH',
+               'zip_code': '411001', 'country': 'India', 'phone': '9999999999'}
+    delivery_date = datetime.date.today()
+
+    legacy_cart = [{
+        'Product ID': product_id,
+        'Product Name': f'Turtle Check Men Navy Blue Shirt {product_id}',
+        'Price': random.uniform(10, 100),
+        'Image URL': f'http://assets.myntassets.com/v1/images/style/properties/{product_id}_images.jpg',
+        'Quantity': 1,
+    } for product_id in product_ids]
+    legacy_orders = [{
+        'order_id': i, 'billing_info': dict(billing), 'cart_items': [dict(item) for item in legacy_cart],
+        'total_amount': 0, 'payment_method': 'GPay', 'delivery_date': delivery_date, 'canceled': False,
+    } for i in range(n_orders)]
+
+    cart = Cart()
+    for item in legacy_cart:
+        cart.add(item['Product ID'], item['Price'])
+    orders = [Order.from_cart(i, cart, BillingInfo(**billing), 'GPay', delivery_date) for i in range(n_orders)]
+
+    legacy = session_footprint({'cart': legacy_cart, 'orders': legacy_orders}, keys=('cart', 'orders'))
+    compact = session_footprint({'cart': cart, 'orders': orders}, keys=('cart', 'orders'))
+    print(f"{n_items} cart items, {n_orders} orders")
+    for key in ('cart', 'orders'):
+        print(f"  {key:<7} dicts: {legacy[key]:>8,} bytes   slotted: {compact[key]:>8,} bytes")
@@ -0,0 +1,114 @@
+"""Change detection for catalog updates.
+
+Rows are keyed on Product Id and compared by a hash of their content, so a
+new catalog version can be turned into inserted/updated/deleted id sets and
+derived structures (TF-IDF, embeddings, trending) only redo the changed rows.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _normalised(frame):
+    # Numbers hash as float64, so 5, 5.0 and a nullable Int64 5 compare equal
+    # when a feed changes a column's dtype
+    numeric = [column for column in frame.columns
+               if pd.api.types.is_numeric_dtype(frame[column]) and not pd.api.types.is_bool_dtype(frame[column])]
+    if not numeric:
+        return frame
+    return frame.astype({column: 'float64' for column in numeric})
+
+
+def row_hashes(catalog, columns=None):
+    """Content hash of each row (optionally of some columns only), indexed by Product Id."""
+    frame = catalog if columns is None else catalog[list(columns)]
+    hashes = pd.util.hash_pandas_object(_normalised(frame), index=False).to_numpy()
+    return pd.Series(hashes, index=catalog['Product Id'].to_numpy())
+
+
+class CatalogChanges:
+    def __init__(self, inserted, updated, deleted, hashes):
+        self.inserted = np.asarray(inserted)
+        self.updated = np.asarray(updated)
+        self.deleted = np.asarray(deleted)
+        self.hashes = hashes  # Row hashes of the new catalog
+
+    @property
+    def changed(self):
+        """Ids whose rows must be recomputed: updated first, then inserted."""
+        return np.concatenate([self.updated, self.inserted])
+
+    def __len__(self):
+        return len(self.inserted) + len(self.updated) + len(self.deleted)
+
+    def __repr__(self):
+        return (f"CatalogChanges(inserted={len(self.inserted)}, updated={len(self.updated)}, "
+                f"deleted={len(self.deleted)})")
+
+
+def diff_catalog(old_hashes, catalog, columns=None):
+    """Compare a catalog with the row hashes of a previous version."""
+    new_hashes = row_hashes(catalog, columns)
+    common = new_hashes.index.intersection(old_hashes.index)
+    changed = new_hashes[common].to_numpy() != old_hashes[common].to_numpy()
+    return CatalogChanges(
+        inserted=new_hashes.index.difference(old_hashes.index, sort=False),
+        updated=common[changed],
+        deleted=old_hashes.index.difference(new_hashes.index, sort=False),
+        hashes=new_hashes,
+    )
+
+
+def reorder_plan(old_ids, changes):
+    """Row layout for applying `changes` to structures whose rows follow `old_ids`.
+
+    Unchanged rows keep their relative order and inserted rows are appended.
+    Returns (new_ids, sources, old_to_new): row i of the new structure is row
+    sources[i] of the old rows stacked on top of the recomputed rows for
+    changes.changed, and old_to_new maps old positions to new ones (-1 when
+    deleted).
+    """
+    old_ids = np.asarray(old_ids)
+    keep = ~np.isin(old_ids, changes.deleted)
+    new_ids = np.concatenate([old_ids[keep], changes.inserted]).astype(old_ids.dtype, copy=False)
+
+    old_to_new = np.full(len(old_ids), -1, dtype=np.int64)
+    old_to_new[keep] = np.arange(keep.sum())
+
+    sources = np.concatenate([np.flatnonzero(keep), np.arange(len(changes.inserted)) + len(old_ids) + len(changes.updated)])
+    if len(changes.updated):
+        updated_old = pd.Index(old_ids).get_indexer(changes.updated)
+        sources[old_to_new[updated_old]] = len(old_ids) + np.arange(len(changes.updated))
+    return new_ids, sources, old_to_new
+
+
+def apply_feed(catalog, rows, deleted_ids=()):
+    """New catalog with feed `rows` upserted by Product Id and `deleted_ids` removed.
+
+    Feed rows may carry only some columns (e.g. a price or description
+    update); columns they leave out or leave empty keep their current values.
+    """
+    indexed = catalog.set_index('Product Id')
+    feed = rows.set_index('Product Id')
+    existing = feed.index.intersection(indexed.index)
+    for column in feed.columns:
+        values = feed.loc[existing, column]
+        values = values[values.notna()]
+        indexed.loc[values.index, column] = values
+
+    inserted = feed.loc[feed.index.difference(indexed.index)]
+    indexed = indexed.drop(index=list(deleted_ids), errors='ignore')
+    merged = pd.concat([indexed, inserted.reindex(columns=indexed.columns)])
+    merged['Description'] = merged['Description'].fillna('')
+
+    # Keep column order and dtypes so unchanged rows hash the same
+    columns = list(catalog.columns) + [column for column in feed.columns if column not in catalog.columns]
+    merged = merged.rename_axis('Product Id').reset_index()[columns]
+    for column, dtype in catalog.dtypes.items():
+        if merged[column].dtype != dtype:
+            try:
+                merged[column] = merged[column].astype(dtype)
+            except (TypeError, ValueError):
+                # Missing values in an integer column: keep integers, as nullable ones
+                if pd.api.types.is_integer_dtype(dtype):
+                    merged[column] = merged[column].astype('Int64')
+    return merged
@@ -0,0 +1,195 @@
+"""Order commits for the checkout page.
+
+An order, its line items and the clearing of the user's cart are written in
+one SQLite BEGIN IMMEDIATE transaction. Order ids come from an AUTOINCREMENT
+key, so they only ever grow, and each checkout attempt carries an
+idempotency key so a repeated submit returns the order already placed.
+
+Run `python checkout.py` to measure commit latency under concurrency.
+"""
+import datetime
+import sqlite3
+import threading
+import time
+
+from cart_models import BillingInfo, Order, OrderLine, cart_key
+
+DB_PATH = 'users.db'
+FIRST_ORDER_ID = 100001  # Keeps ids six digits like the old random ones
+BUSY_TIMEOUT = 30        # Seconds to wait for another writer
+
+# Writers in this process queue here instead of in SQLite's sleeping busy handler
+_commit_lock = threading.Lock()
+
+
+def connect(path=DB_PATH):
+    """Connection with manual transaction control (autocommit outside BEGIN)."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')  # Readers don't block the committing writer
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def create_order_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS orders (
+                        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT NOT NULL,
+                        idempotency_key TEXT UNIQUE NOT NULL,
+                        full_name TEXT,
+                        address TEXT,
+                        city TEXT,
+                        state TEXT,
+                        zip_code TEXT,
+                        country TEXT,
+                        phone TEXT,
+                        payment_method TEXT,
+                        total_amount REAL,
+                        delivery_date TEXT,
+                        created_at TEXT,
+                        canceled INTEGER DEFAULT 0,
+                        FOREIGN KEY (username) REFERENCES users (username)
+                    );''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS order_items (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        order_id INTEGER NOT NULL,
+                        product_id TEXT,
+                        price REAL,
+                        quantity INTEGER,
+                        FOREIGN KEY (order_id) REFERENCES orders (order_id)
+                    );''')
+    conn.execute('CREATE INDEX IF NOT EXISTS order_items_order_id ON order_items (order_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS orders_username ON orders (username)')
+    # Start the id sequence at FIRST_ORDER_ID
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'orders', ? "
+                 "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'orders')",
+                 (FIRST_ORDER_ID - 1,))
+
+
+def place_order(conn, username, cart, billing_info, payment_method, delivery_date, idempotency_key):
+    """Commit an order from `cart` and clear the user's saved cart in one transaction.
+
+    Returns (order_id, created). When `idempotency_key` was already used,
+    nothing is written and the existing order id is returned with created=False.
+    """
+    lines = [(cart_key(item.product_id), item.price, item.quantity) for item in cart]
+    total_amount = sum(price * quantity for _, price, quantity in lines)
+
+    with _commit_lock:
+        return _place_order(conn, username, lines, total_amount, billing_info, payment_method,
+                            delivery_date, idempotency_key)
+
+
+def _place_order(conn, username, lines, total_amount, billing_info, payment_method, delivery_date,
+                 idempotency_key):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT order_id FROM orders WHERE idempotency_key=?', (idempotency_key,)).fetchone()
+        if row is not None:
+            conn.execute('COMMIT')
+            return row[0], False
+
+        cursor = conn.execute(
+            'INSERT INTO orders (username, idempotency_key, full_name, address, city, state, zip_code, country, '
+            'phone, payment_method, total_amount, delivery_date, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (username, idempotency_key, billing_info.full_name, billing_info.address, billing_info.city,
+             billing_info.state, billing_info.zip_code, billing_info.country, billing_info.phone,
+             payment_method, total_amount, delivery_date.isoformat(), datetime.datetime.now().isoformat()))
+        order_id = cursor.lastrowid
+        conn.executemany('INSERT INTO order_items (order_id, product_id, price, quantity) VALUES (?, ?, ?, ?)',
+                         [(order_id, *line) for line in lines])
+        conn.execute('DELETE FROM cart WHERE username=?', (username,))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return order_id, True
+
+
+def load_orders(conn, username):
+    """All orders of a user as Order records, newest first."""
+    orders = conn.execute(
+        'SELECT order_id, full_name, address, city, state, zip_code, country, phone, payment_method, '
+        'total_amount, delivery_date, canceled FROM orders WHERE username=? ORDER BY order_id DESC',
+        (username,)).fetchall()
+    if not orders:
+        return []
+
+    lines = {}
+    placeholders = ', '.join('?' * len(orders))
+    for order_id, product_id, price, quantity in conn.execute(
+            f'SELECT order_id, product_id, price, quantity FROM order_items '
+            f'WHERE order_id IN ({placeholders}) ORDER BY id', [row[0] for row in orders]):
+        lines.setdefault(order_id, []).append(OrderLine(product_id, price, quantity))
+
+    return [
+        Order(order_id, BillingInfo(*billing), tuple(lines.get(order_id, ())), total_amount, payment_method,
+              datetime.date.fromisoformat(delivery_date), bool(canceled))
+        for order_id, *billing, payment_method, total_amount, delivery_date, canceled in orders
+    ]
+
+
+def cancel_order(conn, username, order_id):
+    """Mark an order canceled. Returns False if the user has no such open order."""
+    cursor = conn.execute('UPDATE orders SET canceled=1 WHERE order_id=? AND username=? AND canceled=0',
+                          (order_id, username))
+    return cursor.rowcount == 1
+
+
+if __name__ == '__main__':
+    # Commit latency with many concurrent checkouts against one database file
+    import argparse
+    import os
+    import statistics
+    import tempfile
+    import uuid
+
+    from cart_models import Cart
+
+    parser = argparse.ArgumentParser(description="Benchmark concurrent order commits.")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--orders', type=int, default=100, help="Orders per thread")
+    parser.add_argument('--items', type=int, default=5, help="Items per order")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    setup = connect(path)
+    setup.execute('CREATE TABLE cart (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, product_id TEXT, '
+                  'product_name TEXT, price REAL, image_url TEXT)')
+    create_order_tables(setup)
+    billing = BillingInfo('A Customer', '1 Main Road', 'Pune', 'MH', '411001', 'India', '9999999999')
+    latencies = []
+    duplicates = []
+
+    def worker(thread_id):
+        conn = connect(path)
+        username = f'user{thread_id}'
+        for n in range(args.orders):
+            cart = Cart()
+            for i in range(args.items):
+                cart.add(10000 + i, 199.0)
+            key = uuid.uuid4().hex
+            started = time.perf_counter()
+            order_id, _ = place_order(conn, username, cart, billing, 'GPay', datetime.date.today(), key)
+            latencies.append(time.perf_counter() - started)
+            # A double click replays the same key
+            if n % 10 == 0:
+                duplicates.append(place_order(conn, username, cart, billing, 'GPay', datetime.date.today(), key) == (order_id, False))
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    orders = setup.execute('SELECT COUNT(*), COUNT(DISTINCT order_id), MIN(order_id), MAX(order_id) FROM orders').fetchone()
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{args.threads} threads x {args.orders} orders: {len(latencies) / elapsed:,.0f} commits/s")
+    print(f"  latency p50 {quantiles[49] * 1000:.2f} ms  p95 {quantiles[94] * 1000:.2f} ms  "
+          f"p99 {quantiles[98] * 1000:.2f} ms  max {latencies[-1] * 1000:.2f} ms")
+    print(f"  orders stored {orders[0]} (ids {orders[2]}-{orders[3]}), "
+          f"replayed keys deduplicated: {all(duplicates)}")
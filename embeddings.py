@@ -0,0 +1,255 @@
+"""Dense product embeddings for semantic similarity, computed on CPU.
+
+Descriptions are hashed into word and character n-gram features, weighted
+with TF-IDF and reduced with TruncatedSVD (LSA). The catalog is encoded
+offline in chunks spread over worker processes and written to a
+memory-mapped .npy matrix. Queries score the matrix block by block with
+BLAS matrix products and keep a running top-k, so memory stays bounded for
+large catalogs.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import hstack
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.preprocessing import normalize
+
+from catalog_sync import diff_catalog, reorder_plan, row_hashes
+from facets import FACET_COLUMNS, FacetIndex, candidate_top_k, is_selective
+
+EMBEDDINGS_DIR = 'artifacts'
+EMBEDDING_DIM = 128
+HASH_FEATURES = 2 ** 16
+FIT_SAMPLE_ROWS = 50000   # Rows used to fit the TF-IDF weights and the SVD
+ENCODE_CHUNK_ROWS = 4096  # Rows encoded per task
+QUERY_BLOCK_ROWS = 65536  # Catalog rows scored per matrix product
+EMBEDDING_COLUMNS = ('Description',) + FACET_COLUMNS  # Columns the index depends on
+MATRIX_PATTERN = 'embeddings-*.npy'
+KEEP_MATRICES = 2  # Matrix files kept per directory; older ones are removed after a build
+
+
+class EmbeddingEncoder:
+    """Stateless hashing features followed by fitted TF-IDF weights and SVD projection."""
+
+    def __init__(self, dim=EMBEDDING_DIM, n_features=HASH_FEATURES):
+        self.word_hasher = HashingVectorizer(n_features=n_features, ngram_range=(1, 2),
+                                             alternate_sign=False, norm=None)
+        # Character n-grams catch spelling variants like 'tshirt' / 't-shirt'
+        self.char_hasher = HashingVectorizer(n_features=n_features, analyzer='char_wb', ngram_range=(3, 4),
+                                             alternate_sign=False, norm=None)
+        self.tfidf = TfidfTransformer(sublinear_tf=True)
+        self.svd = TruncatedSVD(n_components=dim, random_state=0)
+
+    def _hashed(self, texts):
+        return hstack([self.word_hasher.transform(texts), self.char_hasher.transform(texts)]).tocsr()
+
+    def fit(self, texts):
+        features = self.tfidf.fit_transform(self._hashed(texts))
+        self.svd.n_components = min(self.svd.n_components, features.shape[0] - 1, features.shape[1] - 1)
+        self.svd.fit(features)
+        # Only the projection is needed at encode time
+        self.components = self.svd.components_.astype(np.float32)
+        return self
+
+    def encode(self, texts, dtype=np.float32):
+        features = self.tfidf.transform(self._hashed(texts))
+        vectors = (features @ self.components.T).astype(np.float32)
+        return normalize(vectors).astype(dtype)
+
+
+# Encoder shared by the tasks of one worker process
+_worker_encoder = None
+
+
+def _init_worker(encoder):
+    global _worker_encoder
+    _worker_encoder = encoder
+
+
+def _encode_chunk(task):
+    texts, dtype = task
+    return _worker_encoder.encode(texts, dtype)
+
+
+def encode_catalog(descriptions, path, dim=EMBEDDING_DIM, dtype=np.float32, workers=None,
+                   chunk_rows=ENCODE_CHUNK_ROWS):
+    """Encode every description into a memory-mapped (n_rows, dim) matrix at `path`.
+
+    The matrix is written to a uniquely named temporary file and moved into
+    place when complete, so concurrent builds never write to the same file.
+    """
+    texts = [text if isinstance(text, str) else '' for text in descriptions]
+    sample = texts
+    if len(texts) > FIT_SAMPLE_ROWS:
+        rng = np.random.default_rng(0)
+        sample = [texts[i] for i in rng.choice(len(texts), FIT_SAMPLE_ROWS, replace=False)]
+    encoder = EmbeddingEncoder(dim).fit(sample)
+
+    tmp_path, matrix = _create_matrix(path, dtype, (len(texts), encoder.components.shape[0]))
+    starts = range(0, len(texts), chunk_rows)
+    tasks = [(texts[start:start + chunk_rows], dtype) for start in starts]
+    workers = workers or min(4, os.cpu_count() or 1)
+
+    if workers > 1 and len(tasks) > 1:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(encoder,)) as pool:
+            for start, vectors in zip(starts, pool.map(_encode_chunk, tasks)):
+                matrix[start:start + len(vectors)] = vectors
+    else:
+        for start, (chunk, _) in zip(starts, tasks):
+            matrix[start:start + len(chunk)] = encoder.encode(chunk, dtype)
+
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, path)
+    return encoder
+
+
+def _new_matrix_path(directory):
+    """File name for the matrix of a new build; builds never reuse a name."""
+    return os.path.join(directory, f'embeddings-{time.time_ns()}-{os.getpid()}.npy')
+
+
+def _create_matrix(path, dtype, shape):
+    """Open a temporary .npy file next to `path` as a writable memory map."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='tmp-', suffix='.npy')
+    os.close(fd)
+    return tmp_path, np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+
+
+def _remove_old_matrices(directory, keep=KEEP_MATRICES):
+    # Indexes already holding a removed file keep their memory map; new ones only open the latest
+    for path in sorted(glob.glob(os.path.join(directory, MATRIX_PATTERN)))[:-keep]:
+        try:
+            os.remove(path)
+        except OSError:  # Still open on platforms that can't remove open files
+            pass
+
+
+def _write_matrix(path, arrays, sources, chunk_rows=QUERY_BLOCK_ROWS):
+    """Write rows `sources` of the stacked `arrays` to `path` through a temporary file."""
+    offsets = np.cumsum([0] + [len(array) for array in arrays])
+    tmp_path, matrix = _create_matrix(path, arrays[0].dtype, (len(sources), arrays[0].shape[1]))
+    for start in range(0, len(sources), chunk_rows):
+        chunk = sources[start:start + chunk_rows]
+        which = np.searchsorted(offsets, chunk, side='right') - 1
+        for i, array in enumerate(arrays):
+            selected = which == i
+            if selected.any():
+                matrix[start + np.flatnonzero(selected)] = array[chunk[selected] - offsets[i]]
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, path)
+
+
+class EmbeddingIndex:
+    """Top-k cosine search over a memory-mapped embedding matrix."""
+
+    def __init__(self, path, product_ids, encoder=None, facets=None, row_hashes=None):
+        self.path = path
+        self.vectors = np.load(path, mmap_mode='r')
+        self.product_ids = np.asarray(product_ids)
+        self.encoder = encoder
+        self.facets = facets
+        self.row_hashes = row_hashes
+        self.positions = {product_id: i for i, product_id in enumerate(self.product_ids.tolist())}
+
+    def search(self, query, k, exclude=None, mask=None, block_rows=QUERY_BLOCK_ROWS):
+        """Return (positions, scores) of the k rows most similar to a query vector.
+
+        Only rows allowed by `mask` are ranked; a selective mask scores just
+        the matching rows instead of the whole matrix.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if is_selective(mask):
+            candidates = np.flatnonzero(mask)
+            scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+            positions = candidate_top_k(scores, candidates, k, exclude=exclude)
+            return positions, scores[np.searchsorted(candidates, positions)]
+
+        best_positions = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+
+        for start in range(0, len(self.vectors), block_rows):
+            block = np.asarray(self.vectors[start:start + block_rows], dtype=np.float32)
+            scores = block @ query
+            if mask is not None:
+                scores[~mask[start:start + len(block)]] = -np.inf
+            if exclude is not None and start <= exclude < start + len(block):
+                scores[exclude - start] = -np.inf
+
+            # Merge this block's candidates with the running top-k
+            take = min(k, int(np.isfinite(scores).sum()))
+            if take <= 0:
+                continue
+            top = np.argpartition(-scores, take - 1)[:take]
+            best_positions = np.concatenate([best_positions, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_positions, best_scores = best_positions[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores, kind='stable')
+        return best_positions[order], best_scores[order]
+
+    def similar_to(self, product_id, k, filters=None):
+        """Product ids and scores of the k products closest to `product_id`.
+
+        `filters` restricts results by attribute, e.g. {'Gender': 'Men'}.
+        """
+        position = self.positions[product_id]
+        mask = self.facets.mask(filters) if filters else None
+        positions, scores = self.search(self.vectors[position], k, exclude=position, mask=mask)
+        return self.product_ids[positions], scores
+
+    def similar_to_text(self, text, k, filters=None):
+        query = self.encoder.encode([text])[0]
+        mask = self.facets.mask(filters) if filters else None
+        positions, scores = self.search(query, k, mask=mask)
+        return self.product_ids[positions], scores
+
+
+def build_embedding_index(catalog, directory=EMBEDDINGS_DIR, dtype=np.float32, workers=None):
+    """Encode the catalog descriptions and open the resulting matrix for search."""
+    path = _new_matrix_path(directory)
+    encoder = encode_catalog(catalog['Description'].tolist(), path, dtype=dtype, workers=workers)
+    index = EmbeddingIndex(path, catalog['Product Id'].to_numpy(), encoder, FacetIndex(catalog),
+                           row_hashes(catalog, EMBEDDING_COLUMNS))
+    _remove_old_matrices(directory)
+    return index
+
+
+def update_embedding_index(index, catalog, max_changes=0.2):
+    """Encode only the changed products with the existing encoder.
+
+    Unchanged vectors are copied over into a new file; readers still
+    holding the old index keep their memory map of the previous one.
+    """
+    changes = diff_catalog(index.row_hashes, catalog, EMBEDDING_COLUMNS)
+    if not len(changes):
+        return index
+    if len(changes) > max_changes * len(catalog):
+        return build_embedding_index(catalog, os.path.dirname(index.path), index.vectors.dtype)
+
+    if len(changes.changed):
+        descriptions = catalog.set_index('Product Id').loc[changes.changed, 'Description'].tolist()
+        encoded = index.encoder.encode(descriptions, index.vectors.dtype)
+    else:
+        encoded = np.empty((0, index.vectors.shape[1]), dtype=index.vectors.dtype)  # Only deletions
+    new_ids, sources, _ = reorder_plan(index.product_ids, changes)
+    directory = os.path.dirname(index.path)
+    path = _new_matrix_path(directory)
+    _write_matrix(path, [index.vectors, encoded], sources)
+
+    aligned = catalog.set_index('Product Id').loc[new_ids].rename_axis('Product Id').reset_index()
+    updated = EmbeddingIndex(path, new_ids, index.encoder, FacetIndex(aligned), changes.hashes)
+    _remove_old_matrices(directory)
+    return updated
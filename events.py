@@ -0,0 +1,232 @@
+"""Append-only log of user interaction events.
+
+Pages call EventLog.log(), which only puts a tuple on an in-memory queue.
+A background thread drains the queue in batches into a JSONL segment file.
+Full segments are rotated and compacted into Parquet files (when pyarrow is
+installed), so offline jobs can scan the whole history with read_events().
+
+Several processes can share one events directory: each appends to its own
+current segment, closed segments carry the pid in their name, and only one
+process compacts at a time.
+"""
+import atexit
+import glob
+import io
+import json
+import os
+import queue
+import threading
+import time
+import warnings
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Compaction is skipped and segments stay as JSONL
+    pa = None
+    pq = None
+
+EVENTS_DIR = 'events'
+EVENT_FIELDS = ['ts', 'event', 'username', 'product_id', 'query', 'order_id', 'results']
+
+CURRENT_SEGMENT = 'current-{pid}.jsonl'
+CURRENT_PATTERN = 'current*.jsonl'  # Also matches current.jsonl from older versions
+SEGMENT_PATTERN = 'events-*.jsonl'
+PARQUET_PATTERN = 'events-*.parquet'
+COMPACTION_LOCK = 'compaction.lock'
+STALE_LOCK_SECONDS = 600  # A lock this old was left behind by a process that died
+
+
+class EventLog:
+    def __init__(self, directory=EVENTS_DIR, batch_size=500, flush_interval=1.0,
+                 segment_bytes=8 * 1024 * 1024):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self._queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_error = None
+        self.dropped = 0  # Events lost to failed writes
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='event-log', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def close(self):
+        """Flush everything still queued and stop the writer thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def log(self, event, username, product_id=None, query=None, order_id=None, results=None):
+        """Record one event. Never blocks on disk I/O."""
+        self._queue.put((time.time(), event, username, product_id, query, order_id, results))
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+                continue
+            self._flush(self._drain(first))
+        # Anything that arrived after the last poll
+        while not self._queue.empty():
+            self._flush(self._drain(self._queue.get_nowait()))
+
+    def _flush(self, batch):
+        # A full disk or an unserialisable event must not kill the writer thread
+        try:
+            size = self._write(batch)
+        except Exception as e:
+            self.last_error = repr(e)
+            self.dropped += len(batch)
+            return
+        if size >= self.segment_bytes:
+            try:
+                self.rotate()
+            except Exception as e:
+                self.last_error = repr(e)
+
+    def _current_path(self):
+        return os.path.join(self.directory, CURRENT_SEGMENT.format(pid=os.getpid()))
+
+    def _write(self, batch):
+        """Append a batch to the current segment and return its size."""
+        path = self._current_path()
+        lines = []
+        for row in batch:
+            record = dict(zip(EVENT_FIELDS, row))
+            if record['product_id'] is not None:
+                record['product_id'] = str(record['product_id'])
+            if record['order_id'] is not None:
+                record['order_id'] = str(record['order_id'])
+            lines.append(json.dumps(record))
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+            return f.tell()
+
+    def rotate(self):
+        """Close the current segment and compact closed segments to Parquet."""
+        path = self._current_path()
+        if os.path.exists(path):
+            os.replace(path, os.path.join(self.directory, f'events-{time.time_ns()}-{os.getpid()}.jsonl'))
+        compact_segments(self.directory)
+
+
+EVENT_DTYPES = {
+    'ts': 'float64', 'event': 'string', 'username': 'string', 'product_id': 'string',
+    'query': 'string', 'order_id': 'string', 'results': 'Int64',
+}
+
+
+def _read_segment(path):
+    """Events in a JSONL segment.
+
+    Only complete lines are read, since the last one may still be being
+    written. Lines that don't parse, such as one cut off when a writer
+    died, are skipped with a warning.
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    text = text[:text.rfind('\n') + 1]
+    try:
+        frame = pd.read_json(io.StringIO(text), lines=True, dtype=False) if text.strip() else pd.DataFrame()
+    except ValueError:
+        records, skipped = [], 0
+        for line in filter(str.strip, text.splitlines()):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                records.append(record)
+            else:
+                skipped += 1
+        warnings.warn(f"Skipped {skipped} unreadable line(s) in {path}")
+        frame = pd.DataFrame.from_records(records)
+    return frame.reindex(columns=EVENT_FIELDS).astype(EVENT_DTYPES)
+
+
+def _take_lock(path):
+    """Create the lock file, or return False when another process holds it."""
+    for _ in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) < STALE_LOCK_SECONDS:
+                    return False
+                os.remove(path)  # Left behind by a process that died
+            except FileNotFoundError:
+                pass
+    return False
+
+
+def compact_segments(directory=EVENTS_DIR):
+    """Convert each closed JSONL segment into a Parquet file with the same name.
+
+    Returns without doing anything while another process is compacting; its
+    pass will pick up the segments closed so far.
+    """
+    if pq is None:
+        return
+    lock = os.path.join(directory, COMPACTION_LOCK)
+    if not _take_lock(lock):
+        return
+    try:
+        for path in sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN))):
+            target = path[:-len('.jsonl')] + '.parquet'
+            tmp = f'{target}.{os.getpid()}.tmp'
+            try:
+                frame = _read_segment(path)
+            except FileNotFoundError:  # Compacted by a process that took over a stale lock
+                continue
+            pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp)
+            os.replace(tmp, target)
+            os.remove(path)
+    finally:
+        try:
+            os.remove(lock)
+        except FileNotFoundError:
+            pass
+
+
+def read_events(directory=EVENTS_DIR, columns=None):
+    """Load every logged event (compacted, closed and current segments) as a DataFrame."""
+    frames = []
+    parquet_files = sorted(glob.glob(os.path.join(directory, PARQUET_PATTERN)))
+    if parquet_files and pq is not None:
+        frames.append(pq.read_table(parquet_files, columns=columns).to_pandas())
+    jsonl_files = sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN)))
+    jsonl_files += sorted(glob.glob(os.path.join(directory, CURRENT_PATTERN)))
+    for path in jsonl_files:
+        try:
+            frame = _read_segment(path)
+        except FileNotFoundError:  # Rotated or compacted while we were reading
+            continue
+        frames.append(frame if columns is None else frame[columns])
+    if not frames:
+        return pd.DataFrame(columns=columns or EVENT_FIELDS)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,75 @@
+"""Attribute filters (gender, colour, category) applied inside top-k selection.
+
+A FacetIndex holds one boolean mask per attribute value, aligned with the
+rows of the similarity matrix it was built next to. Similarity queries
+combine the masks for a filter and rank only matching rows, so a query
+returns exactly k results in one pass whenever k matching products exist.
+"""
+import numpy as np
+import pandas as pd
+
+FACET_COLUMNS = ('Gender', 'baseColour', 'masterCategory')
+
+# Below this fraction of matching rows, score only the matching rows
+SELECTIVE_FILTER_FRACTION = 0.1
+
+
+class FacetIndex:
+    def __init__(self, catalog, columns=FACET_COLUMNS):
+        self.size = len(catalog)
+        self.masks = {}
+        for column in columns:
+            codes, values = pd.factorize(catalog[column].fillna('').astype(str))
+            self.masks[column] = {value: codes == code for code, value in enumerate(values) if value}
+
+    def values(self, column):
+        return sorted(self.masks[column])
+
+    def mask(self, filters):
+        """Rows matching every filter, or None when nothing is filtered.
+
+        `filters` maps a column to one value or a list of accepted values.
+        """
+        combined = None
+        for column, accepted in (filters or {}).items():
+            if accepted is None:
+                continue
+            if isinstance(accepted, str):
+                accepted = [accepted]
+            if len(accepted) == 0:
+                continue
+            column_mask = np.zeros(self.size, dtype=bool)
+            for value in accepted:
+                value_mask = self.masks[column].get(str(value))
+                if value_mask is not None:
+                    column_mask |= value_mask
+            combined = column_mask if combined is None else combined & column_mask
+        return combined
+
+
+def masked_top_k(scores, k, mask=None, exclude=None):
+    """Positions of the k best scores among rows allowed by `mask`, best first.
+
+    Rows outside the mask (and `exclude`) are never candidates, so fewer than
+    k positions are returned only when fewer than k rows match.
+    """
+    scores = np.array(scores, dtype=np.float32)
+    if mask is not None:
+        scores[~mask] = -np.inf
+    if exclude is not None:
+        scores[exclude] = -np.inf
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def is_selective(mask):
+    return mask is not None and mask.mean() < SELECTIVE_FILTER_FRACTION
+
+
+def candidate_top_k(candidate_scores, candidates, k, exclude=None):
+    """Same as masked_top_k, for scores computed only for `candidates` (row positions)."""
+    allowed = None if exclude is None else candidates != exclude
+    return candidates[masked_top_k(candidate_scores, k, mask=allowed)]
@@ -0,0 +1,546 @@
+"""Background precompute of the heavy catalog artifacts used by the app.
+
+A single worker thread rebuilds each artifact when its input files change,
+when an artifact it depends on publishes a new version, or when its refresh
+interval runs out. Finished builds are published by swapping in a new
+version object, so pages always read the last complete build and never wait
+on a rebuild in progress (only the very first build of an artifact blocks).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from scipy.sparse import vstack
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from catalog_sync import apply_feed, diff_catalog, reorder_plan, row_hashes
+from embeddings import build_embedding_index, update_embedding_index
+from facets import FACET_COLUMNS, FacetIndex, candidate_top_k, is_selective, masked_top_k
+
+CLEANS_DATA_PATH = 'cleans_data.csv'
+STYLES_DATA_PATH = 'styles.csv'
+
+NEIGHBORS_PER_PRODUCT = 20   # Neighbors guaranteed exact per product in the TF-IDF table
+NEIGHBOR_TABLE_DEPTH = 40    # Neighbors stored, so incremental updates rarely recompute a row
+SIMILARITY_BLOCK_ROWS = 1024  # Rows per block when computing similarities
+TRENDING_POOL_SIZE = 100     # Products the trending page samples from
+IMAGE_CHECK_WORKERS = 8
+IMAGE_CHECK_TIMEOUT = 5
+
+TFIDF_COLUMNS = ('Description',) + FACET_COLUMNS  # Columns the TF-IDF artifact depends on
+TRENDING_COLUMNS = ('Rating', 'ReviewCount')        # Columns trending scores depend on
+TFIDF_REFIT_DRIFT = 0.02      # Refit the vocabulary once this share of new tokens is unknown
+INCREMENTAL_MAX_CHANGES = 0.2  # Above this share of changed rows, rebuild from scratch
+
+
+# Artifact builders
+
+def build_catalog():
+    """Merge the product CSVs into the catalog DataFrame used by every page."""
+    cleans_data = pd.read_csv(CLEANS_DATA_PATH)
+    styles_data = pd.read_csv(STYLES_DATA_PATH)
+
+    cleans_columns = ['ID', 'Product Id', 'Category', 'Name', 'Brand', 'Rating', 'ReviewCount', 'Description', 'ImageURL', 'Tags', 'Gender']
+    styles_columns = ['Product Id', 'baseColour', 'gender', 'masterCategory']
+
+    # Merge the datasets on 'Product Id'
+    merged_data = pd.merge(cleans_data[cleans_columns], styles_data[styles_columns], on='Product Id', how='inner')
+
+    # Rename columns if necessary
+    merged_data.rename(columns={
+        'Product Brand': 'Brand',
+        'Product Rating': 'Rating',
+        'Product Image Url': 'ImageURL'
+    }, inplace=True)
+    merged_data['Description'] = merged_data['Description'].fillna('')
+
+    return merged_data
+
+
+def build_catalog_index(catalog):
+    """Catalog keyed by the string Product Id, for display lookups from carts and orders."""
+    return catalog.set_index(catalog['Product Id'].astype(str))
+
+
+def _top_k(sims, k):
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def top_k_neighbors(matrix, k=NEIGHBORS_PER_PRODUCT, block_rows=SIMILARITY_BLOCK_ROWS, rows=None):
+    """Return (neighbor positions, scores) for rows of an L2-normalised matrix.
+
+    Similarities are computed one block of rows at a time so the full
+    N x N matrix is never held in memory. A row is never its own neighbor.
+    `rows` limits the computation to some row positions (default: all).
+    """
+    n_rows = matrix.shape[0]
+    rows = np.arange(n_rows) if rows is None else np.asarray(rows)
+    k = min(k, max(n_rows - 1, 0))
+    neighbors = np.zeros((len(rows), k), dtype=np.int32)
+    scores = np.zeros((len(rows), k), dtype=np.float32)
+    if k == 0:
+        return neighbors, scores
+
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        sims = matrix[block] @ matrix.T
+        sims = sims.toarray() if hasattr(sims, 'toarray') else np.asarray(sims)
+        sims[np.arange(len(block)), block] = -np.inf
+        neighbors[start:start + len(block)], scores[start:start + len(block)] = _top_k(sims, k)
+
+    return neighbors, scores
+
+
+def _token_count(vectorizer, descriptions):
+    analyzer = vectorizer.build_analyzer()
+    tokens = [token for description in descriptions for token in analyzer(description)]
+    unknown = sum(token not in vectorizer.vocabulary_ for token in tokens)
+    return len(tokens), unknown
+
+
+def _aligned(catalog, product_ids):
+    """Catalog rows in the order of `product_ids`."""
+    return catalog.set_index('Product Id').loc[product_ids].rename_axis('Product Id').reset_index()
+
+
+def build_tfidf(catalog):
+    """Fit TF-IDF over product descriptions and precompute each product's neighbors."""
+    vectorizer = TfidfVectorizer(stop_words='english')
+    descriptions = catalog['Description'].fillna('')
+    matrix = vectorizer.fit_transform(descriptions)
+    neighbors, scores = top_k_neighbors(matrix, NEIGHBOR_TABLE_DEPTH)
+    return {
+        'vectorizer': vectorizer,
+        'matrix': matrix,
+        'product_ids': catalog['Product Id'].to_numpy(),
+        'neighbors': neighbors,
+        'scores': scores,
+        # Upper bound on the score of any product missing from a row's list
+        'floor': scores[:, -1].copy() if scores.shape[1] else np.zeros(len(scores), dtype=np.float32),
+        'facets': FacetIndex(catalog),
+        'row_hashes': row_hashes(catalog, TFIDF_COLUMNS),
+        'fit_tokens': _token_count(vectorizer, descriptions)[0],
+        'unknown_tokens': 0,
+    }
+
+
+def update_tfidf(tfidf, catalog):
+    """Apply catalog changes to a TF-IDF artifact without refitting when possible.
+
+    Changed rows are transformed with the existing vocabulary and get their
+    neighbor lists recomputed. Every other row drops entries for updated or
+    deleted products and merges in its similarities to the changed rows.
+    Each row tracks a floor, the best score a product outside its list can
+    have; a row is only recomputed when its first NEIGHBORS_PER_PRODUCT
+    entries can no longer be shown to beat that floor. The vocabulary is
+    refit once the share of unknown tokens seen since the last fit passes
+    TFIDF_REFIT_DRIFT.
+    """
+    changes = diff_catalog(tfidf['row_hashes'], catalog, TFIDF_COLUMNS)
+    if not len(changes):
+        return tfidf
+    if len(changes) > INCREMENTAL_MAX_CHANGES * len(catalog):
+        return build_tfidf(catalog)
+
+    vectorizer = tfidf['vectorizer']
+    descriptions = catalog.set_index('Product Id').loc[changes.changed, 'Description'].fillna('')
+    _, unknown = _token_count(vectorizer, descriptions)
+    unknown_tokens = tfidf['unknown_tokens'] + unknown
+    if unknown_tokens > TFIDF_REFIT_DRIFT * tfidf['fit_tokens']:
+        return build_tfidf(catalog)
+
+    old_ids = tfidf['product_ids']
+    new_ids, sources, old_to_new = reorder_plan(old_ids, changes)
+    if len(changes.changed):
+        matrix = vstack([tfidf['matrix'], vectorizer.transform(descriptions)]).tocsr()[sources]
+    else:
+        matrix = tfidf['matrix'][sources]  # Only deletions
+    depth = tfidf['neighbors'].shape[1]
+    if depth != min(NEIGHBOR_TABLE_DEPTH, len(new_ids) - 1):
+        return build_tfidf(catalog)
+
+    # Carry over the lists of surviving rows, in new positions
+    kept = old_to_new >= 0
+    n_kept = kept.sum()
+    neighbors = np.zeros((len(new_ids), depth), dtype=np.int32)
+    scores = np.full((len(new_ids), depth), -np.inf, dtype=np.float32)
+    floor = np.zeros(len(new_ids), dtype=np.float32)
+    neighbors[:n_kept] = old_to_new[tfidf['neighbors'][kept]]
+    scores[:n_kept] = tfidf['scores'][kept]
+    floor[:n_kept] = tfidf['floor'][kept]
+
+    changed_positions = pd.Index(new_ids).get_indexer(changes.changed)
+    is_changed = np.zeros(len(new_ids), dtype=bool)
+    is_changed[changed_positions] = True
+
+    # Entries for deleted or updated products no longer hold a valid score
+    stale = (neighbors < 0) | is_changed[np.maximum(neighbors, 0)]
+    scores[stale] = -np.inf
+
+    # Merge each unchanged row's list with its similarities to the changed rows
+    # (with no changed rows this just moves stale entries to the end)
+    rows = np.flatnonzero(~is_changed)
+    if len(rows):
+        if len(changed_positions):
+            changed_sims = (matrix[rows] @ matrix[changed_positions].T).toarray()
+        else:
+            changed_sims = np.empty((len(rows), 0), dtype=np.float32)
+        candidates = np.hstack([neighbors[rows], np.broadcast_to(changed_positions, changed_sims.shape)])
+        candidate_scores = np.hstack([scores[rows], changed_sims])
+        top, scores[rows] = _top_k(candidate_scores, depth)
+        neighbors[rows] = np.take_along_axis(candidates, top, axis=1)
+        if candidate_scores.shape[1] > depth:
+            # The best candidate that did not make the list raises the floor
+            dropped = -np.partition(-candidate_scores, depth, axis=1)[:, depth]
+            floor[rows] = np.maximum(floor[rows], dropped)
+
+    # Changed rows, and rows whose exact prefix fell below the floor, are recomputed
+    exact = min(NEIGHBORS_PER_PRODUCT, depth)
+    recompute = np.flatnonzero(is_changed | (scores[:, exact - 1] < floor))
+    neighbors[recompute], scores[recompute] = top_k_neighbors(matrix, depth, rows=recompute)
+    floor[recompute] = scores[recompute, -1]
+
+    return {
+        'vectorizer': vectorizer,
+        'matrix': matrix,
+        'product_ids': new_ids,
+        'neighbors': neighbors,
+        'scores': scores,
+        'floor': floor,
+        'facets': FacetIndex(_aligned(catalog, new_ids)),
+        'row_hashes': changes.hashes,
+        'fit_tokens': tfidf['fit_tokens'],
+        'unknown_tokens': unknown_tokens,
+    }
+
+
+def tfidf_similar(tfidf, position, k, filters=None):
+    """Positions of the k products most similar to the one at `position`.
+
+    Unfiltered queries read the precomputed neighbor table. Filtered queries
+    rank only the products matching `filters`, so they still return k rows.
+    """
+    mask = tfidf['facets'].mask(filters)
+    if mask is None and k <= NEIGHBORS_PER_PRODUCT:
+        return tfidf['neighbors'][position][:k]
+
+    matrix = tfidf['matrix']
+    query = matrix[position].T
+    if is_selective(mask):
+        candidates = np.flatnonzero(mask)
+        scores = (matrix[candidates] @ query).toarray().ravel()
+        return candidate_top_k(scores, candidates, k, exclude=position)
+    scores = (matrix @ query).toarray().ravel()
+    return masked_top_k(scores, k, mask, exclude=position)
+
+
+def _ratings_and_reviews(catalog):
+    ratings = pd.to_numeric(catalog['Rating'], errors='coerce').fillna(0)
+    reviews = pd.to_numeric(catalog['ReviewCount'], errors='coerce').fillna(0).clip(lower=0)
+    return ratings, reviews
+
+
+def _trending_scores(catalog, mean_rating, prior_weight):
+    # Bayesian average pulls ratings with few reviews towards the catalog mean
+    ratings, reviews = _ratings_and_reviews(catalog)
+    score = (ratings * reviews + mean_rating * prior_weight) / (reviews + prior_weight).replace(0, 1)
+    return pd.Series(score.to_numpy(), index=catalog['Product Id'].to_numpy())
+
+
+def _trending_pool(catalog_by_product, scores):
+    top = scores.nlargest(TRENDING_POOL_SIZE)
+    pool = catalog_by_product.loc[top.index].rename_axis('Product Id').reset_index()
+    return pool.assign(**{'Trending Score': top.to_numpy()})
+
+
+def build_trending(catalog):
+    """Score products by review-weighted rating and keep the top of the list."""
+    ratings, reviews = _ratings_and_reviews(catalog)
+    prior = (ratings.mean(), reviews.median())
+    scores = _trending_scores(catalog, *prior)
+    return {
+        'pool': _trending_pool(catalog.set_index('Product Id'), scores),
+        'scores': scores,
+        'prior': prior,
+        'row_hashes': row_hashes(catalog, TRENDING_COLUMNS),
+    }
+
+
+def update_trending(trending, catalog):
+    """Rescore only the changed products, keeping the prior from the last full build.
+
+    The pool rows are always taken from the new catalog, so edits to
+    display fields show up even when no score changed.
+    """
+    changes = diff_catalog(trending['row_hashes'], catalog, TRENDING_COLUMNS)
+    if len(changes) > INCREMENTAL_MAX_CHANGES * len(catalog):
+        return build_trending(catalog)
+
+    catalog_by_product = catalog.set_index('Product Id')
+    changed = catalog_by_product.loc[changes.changed].reset_index()
+    scores = trending['scores'].drop(index=changes.deleted)
+    scores = pd.concat([scores.drop(index=changes.updated), _trending_scores(changed, *trending['prior'])])
+    return {
+        'pool': _trending_pool(catalog_by_product, scores),
+        'scores': scores,
+        'prior': trending['prior'],
+        'row_hashes': changes.hashes,
+    }
+
+
+def check_image_url(image_url):
+    """Return True when the image host answers a HEAD request with 200."""
+    if not isinstance(image_url, str) or pd.isna(image_url):
+        return False
+    try:
+        return requests.head(image_url, timeout=IMAGE_CHECK_TIMEOUT).status_code == 200
+    except requests.RequestException:
+        return False
+
+
+def build_image_cache(trending, known=None):
+    """Check every trending product image once, off the request path.
+
+    URLs already in `known` keep their cached result.
+    """
+    known = known or {}
+    urls = trending['pool']['ImageURL'].dropna().unique().tolist()
+    unchecked = [url for url in urls if url not in known]
+    with ThreadPoolExecutor(max_workers=IMAGE_CHECK_WORKERS) as pool:
+        checked = dict(zip(unchecked, pool.map(check_image_url, unchecked)))
+    return {url: known[url] if url in known else checked[url] for url in urls}
+
+
+def update_image_cache(image_cache, trending):
+    return build_image_cache(trending, known=image_cache)
+
+
+# Scheduler
+
+class ArtifactVersion:
+    """One published build of an artifact. Never modified after publishing."""
+
+    def __init__(self, number, value, built_at, build_seconds, incremental=False):
+        self.number = number
+        self.value = value
+        self.built_at = built_at
+        self.build_seconds = build_seconds
+        self.incremental = incremental
+
+
+class Snapshot:
+    """The published artifacts at one point in time, with the scheduler's read methods.
+
+    Used by processes that serve requests from a fixed set of artifacts
+    while the scheduler keeps building new versions elsewhere.
+    """
+
+    def __init__(self, published, stats):
+        self._published = published
+        self._stats = stats
+
+    def get(self, name, wait=True):
+        version = self._published.get(name)
+        if version is None and wait:
+            raise RuntimeError(f"Artifact {name!r} was not built when the snapshot was taken")
+        return None if version is None else version.value
+
+    def versions(self):
+        return {name: version.number for name, version in self._published.items()}
+
+    def stats(self):
+        return self._stats
+
+
+class Artifact:
+    def __init__(self, name, build, inputs=(), depends=(), interval=None, update=None):
+        self.name = name
+        self.build = build
+        self.update = update
+        self.inputs = tuple(inputs)
+        self.depends = tuple(depends)
+        self.interval = interval
+        self.input_mtimes = None
+        self.dependency_versions = None
+        self.last_error = None
+        self.ready = threading.Event()
+
+
+class PrecomputeScheduler:
+    def __init__(self, poll_interval=2.0):
+        self.poll_interval = poll_interval
+        self._artifacts = {}
+        self._published = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._build_lock = threading.Lock()
+
+    def register(self, name, build, inputs=(), depends=(), interval=None, update=None):
+        """Register an artifact. Dependencies must be registered first.
+
+        `update(previous_value, *dependency_values)` is used instead of
+        `build` when a dependency changed and a previous version exists. It
+        may return the previous value unchanged, which publishes nothing.
+        """
+        for dependency in depends:
+            if dependency not in self._artifacts:
+                raise ValueError(f"Unknown dependency {dependency!r} for artifact {name!r}")
+        self._artifacts[name] = Artifact(name, build, inputs, depends, interval, update)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='precompute', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def get(self, name, wait=True):
+        """Return the last finished build of an artifact.
+
+        Only blocks while the artifact has never been built; with wait=False
+        None is returned instead.
+        """
+        version = self._published.get(name)
+        if version is None and wait:
+            artifact = self._artifacts[name]
+            artifact.ready.wait()
+            version = self._published.get(name)
+            if version is None:
+                raise RuntimeError(f"Artifact {name!r} failed to build: {artifact.last_error}")
+        return None if version is None else version.value
+
+    def versions(self):
+        """Published version number of every artifact built so far."""
+        return {name: version.number for name, version in self._published.items()}
+
+    def snapshot(self):
+        """A Snapshot of the current versions, taken between builds."""
+        with self._build_lock:
+            return Snapshot(dict(self._published), self.stats())
+
+    def publish(self, name, value):
+        """Publish a value built outside the scheduler as the next version of an artifact."""
+        with self._build_lock:
+            self._publish(self._artifacts[name], value, 0.0, incremental=True)
+
+    def apply_feed(self, rows, deleted_ids=(), wait=True):
+        """Upsert feed rows into the catalog and update dependent artifacts incrementally.
+
+        With wait=True the dependent artifacts are updated before returning;
+        otherwise the background thread picks the change up on its next poll.
+        The feed is applied in memory; a later change to the CSV files
+        reloads the catalog from them.
+        """
+        self.get('catalog')  # Wait for the first build outside the lock
+        started = time.perf_counter()
+        with self._build_lock:
+            catalog = apply_feed(self._published['catalog'].value, rows, deleted_ids)
+            self._publish(self._artifacts['catalog'], catalog, time.perf_counter() - started, incremental=True)
+        if wait:
+            self.run_pending()
+
+    def stats(self):
+        """Version number, build time and last error for every artifact."""
+        rows = []
+        for name, artifact in self._artifacts.items():
+            version = self._published.get(name)
+            rows.append({
+                'artifact': name,
+                'version': version.number if version else 0,
+                'built_at': version.built_at if version else None,
+                'build_seconds': version.build_seconds if version else None,
+                'incremental': version.incremental if version else None,
+                'error': artifact.last_error,
+            })
+        return rows
+
+    def run_pending(self):
+        """Rebuild every stale artifact once, in registration order."""
+        with self._build_lock:
+            for artifact in self._artifacts.values():
+                if self._stop.is_set():
+                    break
+                self._build_if_stale(artifact)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(self.poll_interval)
+
+    def _input_mtimes(self, artifact):
+        return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in artifact.inputs)
+
+    def _build_if_stale(self, artifact):
+        current = self._published.get(artifact.name)
+        mtimes = self._input_mtimes(artifact)
+        dependencies = [self._published.get(name) for name in artifact.depends]
+        missing = [name for name, dependency in zip(artifact.depends, dependencies) if dependency is None]
+        if missing:
+            if current is None and all(self._artifacts[name].ready.is_set() for name in missing):
+                # A dependency failed its first build; release anyone waiting on this one
+                artifact.last_error = f"Dependencies not available: {', '.join(missing)}"
+                artifact.ready.set()
+            return
+        dependency_versions = tuple(dependency.number for dependency in dependencies)
+
+        expired = current is not None and artifact.interval is not None and time.time() - current.built_at >= artifact.interval
+        inputs_changed = mtimes != artifact.input_mtimes
+        if not (current is None or inputs_changed or expired or dependency_versions != artifact.dependency_versions):
+            return
+        incremental = artifact.update is not None and current is not None and not (inputs_changed or expired)
+
+        started = time.perf_counter()
+        try:
+            dependency_values = [dependency.value for dependency in dependencies]
+            if incremental:
+                try:
+                    value = artifact.update(current.value, *dependency_values)
+                except Exception:
+                    # A failing update must not pin the artifact to its old version
+                    incremental = False
+            if not incremental:
+                value = artifact.build(*dependency_values)
+        except Exception as e:
+            # Keep serving the previous version; retry on the next poll
+            artifact.last_error = repr(e)
+            artifact.ready.set()
+            return
+
+        artifact.input_mtimes = mtimes
+        artifact.dependency_versions = dependency_versions
+        if current is not None and value is current.value:
+            artifact.last_error = None
+            return  # Nothing changed; keep the current version
+        self._publish(artifact, value, time.perf_counter() - started, incremental)
+
+    def _publish(self, artifact, value, build_seconds, incremental=False):
+        current = self._published.get(artifact.name)
+        number = current.number + 1 if current else 1
+        self._published[artifact.name] = ArtifactVersion(number, value, time.time(), build_seconds, incremental)
+        artifact.last_error = None
+        artifact.ready.set()
+
+
+def create_scheduler(poll_interval=2.0):
+    """Scheduler with the catalog, TF-IDF, embedding, trending and image cache artifacts registered."""
+    scheduler = PrecomputeScheduler(poll_interval)
+    scheduler.register('catalog', build_catalog, inputs=(CLEANS_DATA_PATH, STYLES_DATA_PATH))
+    scheduler.register('catalog_by_id', build_catalog_index, depends=('catalog',))
+    scheduler.register('tfidf', build_tfidf, depends=('catalog',), update=update_tfidf)
+    scheduler.register('embeddings', build_embedding_index, depends=('catalog',), update=update_embedding_index)
+    scheduler.register('trending', build_trending, depends=('catalog',), update=update_trending)
+    scheduler.register('image_cache', build_image_cache, depends=('trending',), interval=15 * 60,
+                       update=update_image_cache)
+    return scheduler
@@ -0,0 +1,274 @@
+"""Reporting CLI for carts, wishlists and orders.
+
+The app databases are attached to one read-only SQLite connection and each
+table is read as the union of its copies. Query results are fetched in
+fetchmany() chunks and turned into Arrow record batches, which are reduced
+per product as they arrive and joined with the catalog (cached as Parquet)
+only at the end, so memory follows the size of the catalog rather than the
+number of rows.
+
+    python reports.py top-wishlisted --limit 20
+    python reports.py abandoned-carts --output abandoned.csv
+    python reports.py top-sellers --output sellers.parquet
+    python reports.py export cart cart.parquet
+"""
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cart_models import cart_key
+from precompute import CLEANS_DATA_PATH, STYLES_DATA_PATH, build_catalog
+
+# Schema name -> database file; the first one is the main database
+DATABASES = {'main': 'users.db', 'ecommerce': 'ecommerce.db', 'legacy': 'your_database.db'}
+FETCH_ROWS = 65536          # Rows per fetchmany() call and record batch
+COMPACT_ROWS = 1_000_000    # Partial aggregate rows kept before they are merged
+CATALOG_CACHE = os.path.join('artifacts', 'catalog.parquet')
+CATALOG_COLUMNS = ['Product Id', 'Name', 'Brand', 'Category', 'masterCategory', 'Gender', 'baseColour', 'Rating']
+
+# Exportable tables and the Arrow type of each column (users is left out on purpose)
+TABLES = {
+    'cart': {'username': pa.string(), 'product_id': pa.string(), 'product_name': pa.string(),
+             'price': pa.float64()},
+    'wishlist': {'username': pa.string(), 'product_id': pa.string(), 'product_name': pa.string()},
+    'orders': {'order_id': pa.int64(), 'username': pa.string(), 'payment_method': pa.string(),
+               'total_amount': pa.float64(), 'delivery_date': pa.string(), 'created_at': pa.string(),
+               'canceled': pa.int64()},
+    'order_items': {'order_id': pa.int64(), 'product_id': pa.string(), 'price': pa.float64(),
+                    'quantity': pa.int64()},
+}
+
+
+def connect(databases=DATABASES):
+    """Read-only connection to the first database with the others attached.
+
+    Database files that don't exist are skipped.
+    """
+    conn = None
+    for schema, path in databases.items():
+        if not os.path.exists(path):
+            continue
+        uri = 'file:' + os.path.abspath(path) + '?mode=ro'
+        if conn is None:
+            conn = sqlite3.connect(uri, uri=True)
+        else:
+            conn.execute('ATTACH DATABASE ? AS ' + schema, (uri,))
+    if conn is None:
+        raise FileNotFoundError(f"None of the databases exist: {', '.join(databases.values())}")
+    return conn
+
+
+def _schemas_with(conn, tables):
+    """Schemas that contain every table in `tables`, as (database file name, schema) pairs."""
+    found = []
+    for _, name, path in conn.execute('PRAGMA database_list').fetchall():
+        present = {row[0] for row in conn.execute(f"SELECT name FROM {name}.sqlite_master WHERE type='table'")}
+        if set(tables) <= present:
+            found.append((os.path.basename(path), name))
+    return found
+
+
+def _column_sql(column, arrow_type):
+    if column == 'product_id':
+        # Keep blobs as they are so _product_ids() can decode them
+        return "CASE WHEN typeof(product_id) = 'blob' THEN product_id ELSE CAST(product_id AS TEXT) END"
+    if arrow_type == pa.string():
+        return f'CAST({column} AS TEXT)'
+    return column
+
+
+def union_query(conn, table, columns=None, source=False):
+    """SQL reading `columns` of `table` from every attached database, and the Arrow schema of its rows.
+
+    With `source`, a first column names the database file each row came from.
+    """
+    columns = columns or list(TABLES[table])
+    selects = [
+        'SELECT ' + ', '.join([f"'{label}'"] * source + [_column_sql(column, TABLES[table][column])
+                                                       for column in columns])
+        + f' FROM {name}.{table}'
+        for label, name in _schemas_with(conn, [table])
+    ]
+    fields = [('source', pa.string())] * source + [(column, TABLES[table][column]) for column in columns]
+    return ' UNION ALL '.join(selects), pa.schema(fields)
+
+
+def _product_ids(values):
+    """Product ids as strings.
+
+    Rows inserted with numpy int64 ids hold 8-byte blobs. The app stores
+    plain ints now, but the shipped databases and rows saved before that
+    still have blobs.
+    """
+    if any(isinstance(value, bytes) for value in values):
+        values = [cart_key(value) if isinstance(value, bytes) else value for value in values]
+    return pa.array(values, type=pa.string())
+
+
+def stream_batches(conn, sql, schema, params=(), chunk_rows=FETCH_ROWS):
+    """Yield the rows of a query as Arrow record batches of at most `chunk_rows` rows.
+
+    An empty batch is yielded when the query returns nothing (or `sql` is
+    empty), so consumers always see the schema.
+    """
+    empty = True
+    cursor = conn.execute(sql, params) if sql else None
+    while cursor is not None:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        empty = False
+        arrays = []
+        for i, field in enumerate(schema):
+            # One comprehension per column; zip(*rows) is several times slower on large chunks
+            values = [row[i] for row in rows]
+            arrays.append(_product_ids(values) if field.name == 'product_id' else pa.array(values, type=field.type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+    if empty:
+        yield pa.RecordBatch.from_pylist([], schema)
+
+
+def _sum_by(table, keys, columns):
+    grouped = table.group_by(keys).aggregate([(column, 'sum') for column in columns])
+    return pa.table({**{key: grouped[key] for key in keys},
+                     **{column: grouped[column + '_sum'] for column in columns}})
+
+
+def grouped_sums(batches, keys, columns=(), compact_rows=COMPACT_ROWS):
+    """Row count ('rows') and sums of `columns` per group over a stream of record batches.
+
+    Each batch is reduced as it arrives and the partial results are merged
+    whenever they pile up, so memory follows the number of groups.
+    """
+    columns = ['rows', *columns]
+    partials, pending = [], 0
+    for batch in batches:
+        table = pa.Table.from_batches([batch]).select(list(keys) + columns[1:])
+        table = table.append_column('rows', pa.array(np.ones(len(table), dtype=np.int64)))
+        partials.append(_sum_by(table, keys, columns))
+        pending += partials[-1].num_rows
+        if pending > compact_rows:
+            partials = [_sum_by(pa.concat_tables(partials), keys, columns)]
+            pending = partials[0].num_rows
+    return _sum_by(pa.concat_tables(partials), keys, columns)
+
+
+def load_catalog(path=CATALOG_CACHE):
+    """Catalog columns used by the reports, rebuilt from the CSVs when they are newer than the cache."""
+    sources = [CLEANS_DATA_PATH, STYLES_DATA_PATH]
+    if not os.path.exists(path) or os.path.getmtime(path) < max(os.path.getmtime(source) for source in sources):
+        catalog = build_catalog().drop_duplicates('Product Id')[CATALOG_COLUMNS]
+        catalog['Product Id'] = catalog['Product Id'].astype(str)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        table = pa.Table.from_pandas(catalog, preserve_index=False)
+        # Plain strings, to match the product ids read from the databases
+        table = table.cast(pa.schema([pa.field(field.name, pa.string() if field.type == pa.large_string() else field.type)
+                                      for field in table.schema]))
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+    return pq.read_table(path)
+
+
+def _with_catalog(per_product, catalog):
+    return per_product.join(catalog, keys='product_id', right_keys='Product Id', join_type='left outer')
+
+
+def top_wishlisted(conn, catalog, limit=20, chunk_rows=FETCH_ROWS):
+    """Products on the most wishlists."""
+    sql, schema = union_query(conn, 'wishlist', ['product_id'])
+    counts = grouped_sums(stream_batches(conn, sql, schema, chunk_rows=chunk_rows), ['product_id'])
+    report = _with_catalog(counts.rename_columns(['product_id', 'wishlists']), catalog)
+    return report.sort_by([('wishlists', 'descending'), ('product_id', 'ascending')]).slice(0, limit)
+
+
+def abandoned_carts(conn, catalog, limit=None, chunk_rows=FETCH_ROWS):
+    """Items still sitting in carts, by brand.
+
+    Checkout clears the cart, so everything left in it was never ordered.
+    """
+    sql, schema = union_query(conn, 'cart', ['product_id', 'price'])
+    per_product = grouped_sums(stream_batches(conn, sql, schema, chunk_rows=chunk_rows), ['product_id'], ['price'])
+    per_product = per_product.append_column('products', pa.array(np.ones(per_product.num_rows, dtype=np.int64)))
+    joined = _with_catalog(per_product, catalog)
+    # Products missing from the catalog are reported under an empty brand
+    joined = joined.set_column(joined.schema.get_field_index('Brand'), 'Brand', joined['Brand'].fill_null(''))
+    report = _sum_by(joined, ['Brand'], ['rows', 'products', 'price'])
+    report = report.rename_columns(['Brand', 'items', 'products', 'value'])
+    report = report.sort_by([('value', 'descending'), ('Brand', 'ascending')])
+    return report if limit is None else report.slice(0, limit)
+
+
+def top_sellers(conn, catalog, limit=20, chunk_rows=FETCH_ROWS):
+    """Products by revenue over orders that were not canceled."""
+    schema = pa.schema([('product_id', pa.string()), ('quantity', pa.int64()), ('revenue', pa.float64())])
+    sql = ' UNION ALL '.join(
+        f"SELECT {_column_sql('product_id', pa.string())}, quantity, price * quantity "
+        f'FROM {name}.order_items JOIN {name}.orders USING (order_id) WHERE NOT canceled'
+        for _, name in _schemas_with(conn, ['orders', 'order_items'])
+    )
+    sums = grouped_sums(stream_batches(conn, sql, schema, chunk_rows=chunk_rows), ['product_id'],
+                        ['quantity', 'revenue'])
+    report = _with_catalog(sums.rename_columns(['product_id', 'order_lines', 'quantity', 'revenue']), catalog)
+    return report.sort_by([('revenue', 'descending'), ('product_id', 'ascending')]).slice(0, limit)
+
+
+def export_table(conn, table, path, chunk_rows=FETCH_ROWS):
+    """Write every row of `table` from all databases to a Parquet file, one batch at a time."""
+    sql, schema = union_query(conn, table, source=True)
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in stream_batches(conn, sql, schema, chunk_rows=chunk_rows):
+            writer.write_batch(batch)
+            rows += len(batch)
+    return rows
+
+
+REPORTS = {
+    'top-wishlisted': top_wishlisted,
+    'abandoned-carts': abandoned_carts,
+    'top-sellers': top_sellers,
+}
+
+
+def write_report(report, path):
+    if path.endswith('.parquet'):
+        pq.write_table(report, path)
+    else:
+        report.to_pandas().to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reports over the cart, wishlist and order databases.")
+    parser.add_argument('--chunk-rows', type=int, default=FETCH_ROWS, help="Rows fetched per batch")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, report in REPORTS.items():
+        command = commands.add_parser(name, help=report.__doc__.splitlines()[0])
+        command.add_argument('--limit', type=int, default=None if report is abandoned_carts else 20)
+        command.add_argument('--output', help="Write to a .parquet or .csv file instead of printing")
+    export = commands.add_parser('export', help=export_table.__doc__)
+    export.add_argument('table', choices=sorted(TABLES))
+    export.add_argument('path')
+    args = parser.parse_args(argv)
+
+    conn = connect()
+    try:
+        if args.command == 'export':
+            rows = export_table(conn, args.table, args.path, args.chunk_rows)
+            print(f"Wrote {rows:,} rows to {args.path}")
+            return
+        report = REPORTS[args.command](conn, load_catalog(), args.limit, args.chunk_rows)
+        if args.output:
+            write_report(report, args.output)
+            print(f"Wrote {report.num_rows:,} rows to {args.output}")
+        else:
+            print(report.to_pandas().to_string(index=False))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""CatalogService request handling and the backend RPC path, over small fake artifacts."""
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from multiprocessing.connection import Listener
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backend
+from backend import BackendClient, CatalogService
+
+
+class FakeSource:
+    def __init__(self, artifacts):
+        self.artifacts = artifacts
+        self.version = dict.fromkeys(artifacts, 1)
+        self.reads = Counter()
+
+    def get(self, name, wait=True):
+        self.reads[name] += 1
+        return self.artifacts.get(name)
+
+    def versions(self):
+        return dict(self.version)
+
+    def stats(self):
+        return []
+
+
+def test_image_checks_are_cached_for_a_while(monkeypatch):
+    checked = []
+    monkeypatch.setattr(backend, 'check_image_url', lambda url: checked.append(url) or True)
+    service = CatalogService(FakeSource({'image_cache': {'http://img/trending.jpg': False}}))
+
+    assert service.image_available('http://img/trending.jpg') is False
+    assert service.image_available('http://img/other.jpg') is True
+    assert service.image_available('http://img/other.jpg') is True
+    assert checked == ['http://img/other.jpg']
+
+    monkeypatch.setattr(backend, 'IMAGE_CHECK_TTL', 0)
+    service.image_available('http://img/other.jpg')
+    assert checked == ['http://img/other.jpg'] * 2
+
+
+def test_similar_accepts_list_filters(monkeypatch):
+    service = CatalogService(FakeSource({'tfidf': {}}))
+    calls = []
+    monkeypatch.setattr(service, '_similar', lambda *args: calls.append(args) or ['p2'])
+
+    filters = {'Gender': ['Women', 'Unisex'], 'baseColour': 'Red'}
+    assert service.similar('tfidf', 'p1', 5, filters) == ['p2']
+    assert calls == [('tfidf', 'p1', 5, filters)]
+    assert backend._filters_key(filters) == backend._filters_key({'baseColour': 'Red', 'Gender': ['Unisex', 'Women']})
+    assert backend._filters_key({'Gender': np.array(['Women', 'Unisex'])}) == backend._filters_key({'Gender': ('Unisex', 'Women')})
+
+
+@pytest.fixture
+def served(monkeypatch):
+    """A client connected over a Unix socket to a CatalogService on a fake source."""
+    monkeypatch.delenv('FASHION_BACKEND_KEY', raising=False)
+    catalog = pd.DataFrame({'Product Id': [15970, 39386], 'Name': ['Shirt', 'Jeans']})
+    source = FakeSource({'catalog': catalog})
+    directory = tempfile.mkdtemp()  # Short path: Unix socket paths are limited to ~100 bytes
+    address = os.path.join(directory, 'backend.sock')
+    listener = Listener(address)
+    thread = threading.Thread(target=backend._accept_loop, args=(listener, CatalogService(source)), daemon=True)
+    thread.start()
+    yield source, BackendClient(address)
+    listener.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_round_trip(served):
+    source, client = served
+    assert client.versions() == {'catalog': 1}
+    assert client.product(15970)['Name'] == 'Shirt'
+    assert client.product(1) is None
+    assert client.stats()['artifacts'] == []
+
+
+def test_errors_are_raised_in_the_client(served):
+    _, client = served
+    with pytest.raises(ValueError, match='Unknown similarity model'):
+        client.similar('bogus', 15970)
+    with pytest.raises(AttributeError, match='Unknown backend method'):
+        client.call('_similar', 'tfidf', 15970, 5, {})
+    with pytest.raises(AttributeError, match='Unknown backend method'):
+        client.call('__init__', None)
+    assert client.versions() == {'catalog': 1}  # The connection is still usable
+
+
+def test_catalog_copy_is_fetched_again_only_on_a_new_version(served):
+    source, client = served
+    assert client.catalog()['Name'].tolist() == ['Shirt', 'Jeans']
+    client.catalog()
+    client.product(39386)
+    assert source.reads['catalog'] == 1
+
+    source.artifacts['catalog'] = pd.DataFrame({'Product Id': [11111], 'Name': ['Scarf']})
+    source.version['catalog'] = 2
+    assert client.product(11111)['Name'] == 'Scarf'
+    client.catalog()
+    assert source.reads['catalog'] == 2
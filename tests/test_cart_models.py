@@ -0,0 +1,30 @@
+"""Cart keys are the same whichever form a product id arrives in."""
+import numpy as np
+
+from cart_models import Cart, cart_key, plain_product_id
+
+BLOB_15970 = (15970).to_bytes(8, 'little', signed=True)  # How sqlite stores a numpy int64
+
+
+def test_plain_product_id():
+    assert plain_product_id(np.int64(15970)) == 15970
+    assert plain_product_id(BLOB_15970) == 15970
+    assert plain_product_id(' 15970 ') == 15970
+    assert plain_product_id('SKU-1') == 'SKU-1'
+    assert cart_key(np.int64(15970)) == cart_key(BLOB_15970) == cart_key(15970) == '15970'
+
+
+def test_cart_add_remove_set_quantity():
+    cart = Cart()
+    cart.add(np.int64(15970), 199.0)
+    cart.add(BLOB_15970, 199.0)
+    cart.add('39386', 450.0)
+    assert [(item.product_id, item.quantity) for item in cart] == [('15970', 2), ('39386', 1)]
+    assert BLOB_15970 in cart and 39386 in cart
+
+    cart.set_quantity(BLOB_15970, 3)
+    assert cart.total() == 3 * 199.0 + 450.0
+
+    cart.remove(np.int64(15970))
+    cart.remove('99999')  # Not in the cart
+    assert [item.product_id for item in cart] == ['39386']
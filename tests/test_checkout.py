@@ -0,0 +1,90 @@
+"""Order commits: idempotency, id order and the single transaction."""
+import datetime
+import sqlite3
+
+import pytest
+
+import checkout
+from cart_models import BillingInfo, Cart
+
+BILLING = BillingInfo('A Customer', '1 Main Road', 'Pune', 'MH', '411001', 'India', '9999999999')
+DELIVERY = datetime.date(2026, 1, 10)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = checkout.connect(str(tmp_path / 'users.db'))
+    conn.execute('CREATE TABLE cart (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, product_id TEXT, '
+                 'product_name TEXT, price REAL, image_url TEXT)')
+    checkout.create_order_tables(conn)
+    yield conn
+    conn.close()
+
+
+def saved_cart(conn, username, *items):
+    cart = Cart()
+    for product_id, price in items:
+        conn.execute('INSERT INTO cart (username, product_id, price) VALUES (?, ?, ?)', (username, product_id, price))
+        cart.add(product_id, price)
+    return cart
+
+
+def place(conn, username, cart, key):
+    return checkout.place_order(conn, username, cart, BILLING, 'GPay', DELIVERY, key)
+
+
+def count(conn, table):
+    return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_replayed_key_returns_the_existing_order(conn):
+    cart = saved_cart(conn, 'alice', ('15970', 199.0), ('39386', 450.0))
+    order_id, created = place(conn, 'alice', cart, 'key-1')
+    assert created
+    assert place(conn, 'alice', cart, 'key-1') == (order_id, False)
+    assert count(conn, 'orders') == 1 and count(conn, 'order_items') == 2
+
+
+def test_order_ids_increase_from_first_order_id(conn):
+    ids = [place(conn, 'alice', saved_cart(conn, 'alice', ('15970', 199.0)), f'key-{i}')[0] for i in range(3)]
+    assert ids == [checkout.FIRST_ORDER_ID, checkout.FIRST_ORDER_ID + 1, checkout.FIRST_ORDER_ID + 2]
+
+
+def test_order_and_cleared_cart_commit_together(conn, tmp_path):
+    saved_cart(conn, 'bob', ('11111', 10.0))
+    cart = saved_cart(conn, 'alice', ('15970', 199.0), ('15970', 199.0))
+    order_id, _ = place(conn, 'alice', cart, 'key-1')
+
+    # A second connection sees the order and the emptied cart at once
+    other = sqlite3.connect(str(tmp_path / 'users.db'))
+    assert other.execute('SELECT username FROM cart').fetchall() == [('bob',)]
+    assert other.execute('SELECT product_id, price, quantity FROM order_items WHERE order_id=?',
+                         (order_id,)).fetchall() == [('15970', 199.0, 2)]
+    assert other.execute('SELECT total_amount FROM orders').fetchone() == (398.0,)
+    other.close()
+
+
+def test_blob_product_ids_are_stored_as_numbers(conn):
+    blob = (15970).to_bytes(8, 'little', signed=True)  # A numpy int64 saved by sqlite
+    place(conn, 'alice', saved_cart(conn, 'alice', (blob, 199.0)), 'key-1')
+    assert checkout.load_orders(conn, 'alice')[0].lines[0].product_id == '15970'
+
+
+def test_failed_insert_rolls_back_and_keeps_the_cart(conn):
+    cart = saved_cart(conn, 'alice', ('15970', 199.0))
+    conn.execute("CREATE TRIGGER fail BEFORE INSERT ON order_items BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+    with pytest.raises(sqlite3.IntegrityError):
+        place(conn, 'alice', cart, 'key-1')
+    assert count(conn, 'orders') == 0 and count(conn, 'cart') == 1
+
+    # The key was not used up by the failed attempt
+    conn.execute('DROP TRIGGER fail')
+    assert place(conn, 'alice', cart, 'key-1')[1]
+
+
+def test_cancel_order(conn):
+    order_id, _ = place(conn, 'alice', saved_cart(conn, 'alice', ('15970', 199.0)), 'key-1')
+    assert not checkout.cancel_order(conn, 'mallory', order_id)
+    assert checkout.cancel_order(conn, 'alice', order_id)
+    assert not checkout.cancel_order(conn, 'alice', order_id)  # Already canceled
+    assert checkout.load_orders(conn, 'alice')[0].canceled
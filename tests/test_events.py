@@ -0,0 +1,53 @@
+"""EventLog survives write failures and can be shared by several processes."""
+import multiprocessing
+import time
+
+import pytest
+
+from events import EventLog, read_events
+
+
+def write_events(directory, worker, count):
+    log = EventLog(directory, batch_size=10, flush_interval=0.05, segment_bytes=2000).start()
+    for i in range(count):
+        log.log('search', f'user{worker}', query=f'q{i}', results=i)
+    log.close()
+
+
+def test_processes_share_a_directory(tmp_path):
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=write_events, args=(str(tmp_path), worker, 300)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    events = read_events(str(tmp_path))
+    assert len(events) == 4 * 300
+    assert events.groupby('username')['query'].nunique().tolist() == [300] * 4
+    assert list(tmp_path.glob('*.tmp')) == [] and not (tmp_path / 'compaction.lock').exists()
+
+
+def test_writer_thread_survives_a_failed_write(tmp_path):
+    log = EventLog(str(tmp_path), flush_interval=0.05).start()
+    log.log('search', 'alice', query=object())  # Not JSON serialisable
+    time.sleep(0.3)
+    assert log._thread.is_alive()
+    log.log('search', 'alice', query='shoes')
+    log.close()
+    assert log.dropped == 1 and 'TypeError' in log.last_error
+    assert read_events(str(tmp_path))['query'].tolist() == ['shoes']
+
+
+def test_read_events_skips_cut_off_lines(tmp_path):
+    good = '{"ts": 1.0, "event": "search", "username": "alice", "query": "shoes", "results": 3}\n'
+    # A writer still appending, and one that died mid-line before its pid was reused
+    (tmp_path / 'current-101.jsonl').write_text(good + '{"ts": 2.0, "event": "sea')
+    (tmp_path / 'current-102.jsonl').write_text(good + '{"ts": 2.0, "ev' + good)
+    (tmp_path / 'current-103.jsonl').write_text('{"ts": 2.0, "ev')
+
+    with pytest.warns(UserWarning, match='current-102'):
+        events = read_events(str(tmp_path))
+    assert events['username'].tolist() == ['alice', 'alice']
+    assert events['results'].tolist() == [3, 3]
@@ -0,0 +1,72 @@
+"""Filtered similarity queries return exactly k matching rows in one pass."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from embeddings import build_embedding_index
+from facets import FacetIndex, is_selective
+from precompute import build_tfidf, tfidf_similar
+
+WORDS = ('cotton shirt denim jeans leather wallet silver watch running shoes summer dress wool scarf '
+         'printed kurta casual sneakers formal trousers floral skirt sports jacket analog strap').split()
+K = 10
+
+FILTERS = {
+    'selective': {'masterCategory': 'Footwear'},
+    'full scan': {'Gender': 'Women'},
+    'list': {'Gender': ['Women', 'Unisex'], 'baseColour': 'Red'},
+    'array': {'Gender': np.array(['Men']), 'masterCategory': []},
+}
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    rng = np.random.default_rng(0)
+    n = 600
+    return pd.DataFrame({
+        'Product Id': np.arange(1000, 1000 + n),
+        'Description': [' '.join(rng.choice(WORDS, rng.integers(5, 12))) for _ in range(n)],
+        'Gender': rng.choice(['Men', 'Women', 'Unisex'], n),
+        'baseColour': rng.choice(['Red', 'Blue', 'Black'], n),
+        'masterCategory': rng.choice(['Apparel', 'Accessories', 'Footwear'], n, p=[0.6, 0.35, 0.05]),
+    })
+
+
+def assert_matches_brute_force(positions, scores, similarities, mask, position):
+    allowed = mask.copy()
+    allowed[position] = False
+    assert len(positions) == K <= allowed.sum()
+    assert allowed[positions].all()
+    expected = np.sort(similarities[allowed])[::-1][:K]
+    np.testing.assert_allclose(np.sort(scores)[::-1], expected, atol=1e-5)
+
+
+def test_filter_paths(catalog):
+    facets = FacetIndex(catalog)
+    assert is_selective(facets.mask(FILTERS['selective']))
+    assert not is_selective(facets.mask(FILTERS['full scan']))
+    assert facets.mask({'Gender': []}) is None
+    np.testing.assert_array_equal(facets.mask(FILTERS['array']), (catalog['Gender'] == 'Men').to_numpy())
+
+
+@pytest.mark.parametrize('name', FILTERS)
+def test_tfidf_similar_with_filters(catalog, name):
+    tfidf = build_tfidf(catalog)
+    mask = tfidf['facets'].mask(FILTERS[name])
+    matrix = tfidf['matrix']
+    for position in (0, 123, len(catalog) - 1):
+        similarities = (matrix @ matrix[position].T).toarray().ravel()
+        positions = tfidf_similar(tfidf, position, K, FILTERS[name])
+        assert_matches_brute_force(positions, similarities[positions], similarities, mask, position)
+
+
+@pytest.mark.parametrize('name', FILTERS)
+def test_embedding_similar_to_with_filters(catalog, name, tmp_path):
+    index = build_embedding_index(catalog, directory=str(tmp_path), workers=1)
+    mask = index.facets.mask(FILTERS[name])
+    vectors = np.asarray(index.vectors, dtype=np.float32)
+    for position in (0, 123, len(catalog) - 1):
+        similarities = vectors @ vectors[position]
+        product_ids, scores = index.similar_to(index.product_ids[position], K, FILTERS[name])
+        positions = np.array([index.positions[product_id] for product_id in product_ids])
+        assert_matches_brute_force(positions, scores, similarities, mask, position)
@@ -0,0 +1,178 @@
+"""Incremental catalog updates must match a full rebuild."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog_sync import apply_feed, diff_catalog, reorder_plan, row_hashes
+from embeddings import KEEP_MATRICES, build_embedding_index, update_embedding_index
+from facets import FACET_COLUMNS
+from precompute import (NEIGHBORS_PER_PRODUCT, TRENDING_COLUMNS, PrecomputeScheduler, build_tfidf,
+                        top_k_neighbors, update_tfidf)
+
+WORDS = ('cotton shirt denim jeans leather wallet silver watch running shoes summer dress wool scarf '
+         'printed kurta casual sneakers formal trousers floral skirt sports jacket analog strap slim fit '
+         'checked collar sleeve round neck polo hoodie zipper pocket canvas belt buckle gold earrings').split()
+
+
+def make_catalog(n=300, start=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ID': np.arange(n),
+        'Product Id': np.arange(start, start + n),
+        'Name': [f"Product {i}" for i in range(n)],
+        'Description': [' '.join(rng.choice(WORDS, rng.integers(6, 14))) for _ in range(n)],
+        'Gender': rng.choice(['Men', 'Women', 'Unisex'], n),
+        'baseColour': rng.choice(['Red', 'Blue', 'Black', 'White'], n),
+        'masterCategory': rng.choice(['Apparel', 'Accessories', 'Footwear'], n),
+        'Rating': rng.uniform(1, 5, n).round(1),
+        'ReviewCount': rng.integers(0, 500, n),
+    })
+
+
+def new_rows(n, start, seed=1):
+    return make_catalog(n, start=start, seed=seed)
+
+
+def updated_descriptions(catalog, ids, seed=2):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Product Id': ids,
+        'Description': [' '.join(rng.choice(WORDS, 10)) for _ in ids],
+    })
+
+
+FEEDS = {
+    'insert': lambda catalog: apply_feed(catalog, new_rows(5, start=5000)),
+    'update': lambda catalog: apply_feed(catalog, updated_descriptions(catalog, [1003, 1050, 1100, 1200, 1299])),
+    'delete and update': lambda catalog: apply_feed(
+        catalog, updated_descriptions(catalog, [1010, 1020, 1030]), deleted_ids=[1001, 1002, 1040, 1150, 1250]),
+    'delete only': lambda catalog: apply_feed(
+        catalog, pd.DataFrame({'Product Id': []}), deleted_ids=[1000, 1005, 1060, 1160, 1260]),
+}
+
+
+def assert_exact_neighbors(tfidf):
+    k = NEIGHBORS_PER_PRODUCT
+    matrix = tfidf['matrix']
+    _, full_scores = top_k_neighbors(matrix, k)
+    np.testing.assert_allclose(tfidf['scores'][:, :k], full_scores, atol=1e-5)
+
+    # The listed neighbors really have the listed scores
+    rows = np.arange(matrix.shape[0])[:, None]
+    listed = tfidf['neighbors'][:, :k]
+    assert (listed >= 0).all() and (listed != rows).all()
+    direct = (matrix @ matrix.T).toarray()[rows, listed]
+    np.testing.assert_allclose(direct, tfidf['scores'][:, :k], atol=1e-5)
+
+
+def assert_aligned(tfidf, catalog):
+    aligned = catalog.set_index('Product Id').loc[tfidf['product_ids']]
+    assert set(tfidf['product_ids']) == set(catalog['Product Id'])
+    expected = tfidf['vectorizer'].transform(aligned['Description'])
+    assert abs(tfidf['matrix'] - expected).max() < 1e-6
+    for column in FACET_COLUMNS:
+        for value, mask in tfidf['facets'].masks[column].items():
+            np.testing.assert_array_equal(mask, (aligned[column] == value).to_numpy())
+
+
+def test_diff_and_reorder_plan():
+    catalog = make_catalog(10)
+    changed = apply_feed(catalog, updated_descriptions(catalog, [1002]), deleted_ids=[1005])
+    changed = apply_feed(changed, new_rows(2, start=2000))
+    changes = diff_catalog(row_hashes(catalog), changed)
+    assert list(changes.inserted) == [2000, 2001]
+    assert list(changes.updated) == [1002]
+    assert list(changes.deleted) == [1005]
+
+    new_ids, sources, old_to_new = reorder_plan(catalog['Product Id'].to_numpy(), changes)
+    assert set(new_ids) == set(changed['Product Id'])
+    assert old_to_new[5] == -1
+    # Row sources index old rows stacked on top of the recomputed (updated, then inserted) rows
+    stacked = np.concatenate([catalog['Product Id'].to_numpy(), changes.changed])
+    np.testing.assert_array_equal(stacked[sources], new_ids)
+
+
+def test_insert_without_integer_columns_changes_only_the_new_row():
+    catalog = make_catalog(50)
+    feed = pd.DataFrame({'Product Id': [9000], 'Name': ['New'], 'Description': ['cotton shirt']})
+    changed = apply_feed(catalog, feed)
+    changes = diff_catalog(row_hashes(catalog, TRENDING_COLUMNS), changed, TRENDING_COLUMNS)
+    assert (len(changes.inserted), len(changes.updated), len(changes.deleted)) == (1, 0, 0)
+    assert changed.loc[changed['Product Id'] != 9000, 'ReviewCount'].tolist() == catalog['ReviewCount'].tolist()
+
+
+@pytest.mark.parametrize('feed', FEEDS)
+def test_update_tfidf_matches_full_recompute(feed):
+    catalog = make_catalog()
+    tfidf = build_tfidf(catalog)
+    changed = FEEDS[feed](catalog)
+
+    updated = update_tfidf(tfidf, changed)
+    assert updated['vectorizer'] is tfidf['vectorizer']  # Took the incremental path
+    assert_aligned(updated, changed)
+    assert_exact_neighbors(updated)
+
+
+@pytest.mark.parametrize('feed', FEEDS)
+def test_update_embedding_index_matches_encoder(feed, tmp_path):
+    catalog = make_catalog()
+    index = build_embedding_index(catalog, directory=str(tmp_path), workers=1)
+    changed = FEEDS[feed](catalog)
+
+    updated = update_embedding_index(index, changed)
+    assert updated.encoder is index.encoder
+    assert updated.path != index.path and np.asarray(index.vectors).shape[0] == len(catalog)
+    assert set(updated.product_ids) == set(changed['Product Id'])
+    descriptions = changed.set_index('Product Id').loc[updated.product_ids, 'Description'].tolist()
+    np.testing.assert_allclose(np.asarray(updated.vectors), updated.encoder.encode(descriptions), atol=1e-5)
+
+    # Search agrees with brute force over the new matrix
+    vectors = np.asarray(updated.vectors)
+    for position in (0, len(vectors) // 2, len(vectors) - 1):
+        _, scores = updated.similar_to(updated.product_ids[position], 5)
+        brute = vectors @ vectors[position]
+        brute[position] = -np.inf
+        np.testing.assert_allclose(scores, np.sort(brute)[::-1][:5], atol=1e-5)
+
+
+def test_each_embedding_build_writes_its_own_file(tmp_path):
+    catalog = make_catalog()
+    index = build_embedding_index(catalog, directory=str(tmp_path), workers=1)
+    for feed in FEEDS.values():
+        catalog = feed(catalog)
+        index = update_embedding_index(index, catalog)
+    assert sorted(p.name for p in tmp_path.iterdir())[-1] == os.path.basename(index.path)
+    assert len(list(tmp_path.iterdir())) == KEEP_MATRICES  # No temporary files left, old matrices removed
+
+
+def test_scheduler_applies_delete_only_feed_incrementally():
+    scheduler = PrecomputeScheduler()
+    scheduler.register('catalog', make_catalog)
+    scheduler.register('tfidf', build_tfidf, depends=('catalog',), update=update_tfidf)
+    scheduler.run_pending()
+
+    scheduler.apply_feed(pd.DataFrame({'Product Id': []}), deleted_ids=[1000, 1001])
+    stats = {row['artifact']: row for row in scheduler.stats()}
+    assert stats['tfidf']['version'] == 2
+    assert stats['tfidf']['incremental'] and stats['tfidf']['error'] is None
+    assert 1000 not in scheduler.get('tfidf')['product_ids']
+
+
+def test_scheduler_falls_back_to_build_when_update_fails():
+    scheduler = PrecomputeScheduler()
+    scheduler.register('catalog', make_catalog)
+
+    def broken_update(previous, catalog):
+        raise ValueError("broken updater")
+
+    scheduler.register('ids', lambda catalog: set(catalog['Product Id']), depends=('catalog',),
+                       update=broken_update)
+    scheduler.run_pending()
+
+    scheduler.apply_feed(pd.DataFrame({'Product Id': []}), deleted_ids=[1000])
+    stats = {row['artifact']: row for row in scheduler.stats()}
+    assert stats['ids']['version'] == 2
+    assert not stats['ids']['incremental']
+    assert 1000 not in scheduler.get('ids')
@@ -0,0 +1,76 @@
+"""Reports over several databases, read in record batches."""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import reports
+
+BLOB = (15970).to_bytes(8, 'little', signed=True)  # A numpy int64 id as sqlite stores it
+
+
+def make_databases(tmp_path):
+    main = sqlite3.connect(tmp_path / 'users.db')
+    main.execute('CREATE TABLE wishlist (username TEXT, product_id TEXT, product_name TEXT)')
+    main.executemany('INSERT INTO wishlist VALUES (?, ?, ?)',
+                     [('alice', BLOB, 'Shirt'), ('bob', '15970', 'Shirt'), ('bob', 39386, 'Jeans')])
+    main.execute('CREATE TABLE cart (username TEXT, product_id TEXT, product_name TEXT, price REAL)')
+    main.commit()
+
+    # A database with the wishlist table but no cart table
+    other = sqlite3.connect(tmp_path / 'ecommerce.db')
+    other.execute('CREATE TABLE wishlist (username TEXT, product_id TEXT, product_name TEXT)')
+    other.execute("INSERT INTO wishlist VALUES ('carol', '39386', 'Jeans')")
+    other.commit()
+    for conn in (main, other):
+        conn.close()
+    return reports.connect({'main': str(tmp_path / 'users.db'), 'ecommerce': str(tmp_path / 'ecommerce.db'),
+                            'legacy': str(tmp_path / 'missing.db')})
+
+
+def test_union_query_reads_every_database(tmp_path):
+    conn = make_databases(tmp_path)
+    sql, schema = reports.union_query(conn, 'wishlist', ['username', 'product_id'], source=True)
+    batches = list(reports.stream_batches(conn, sql, schema, chunk_rows=2))
+    assert [len(batch) for batch in batches] == [2, 2]
+    rows = pa.Table.from_batches(batches).to_pylist()
+    assert rows == [
+        {'source': 'users.db', 'username': 'alice', 'product_id': '15970'},
+        {'source': 'users.db', 'username': 'bob', 'product_id': '15970'},
+        {'source': 'users.db', 'username': 'bob', 'product_id': '39386'},
+        {'source': 'ecommerce.db', 'username': 'carol', 'product_id': '39386'},
+    ]
+
+
+def test_empty_and_missing_tables_yield_an_empty_batch(tmp_path):
+    conn = make_databases(tmp_path)
+    sql, schema = reports.union_query(conn, 'cart')  # Empty in users.db, missing from ecommerce.db
+    assert [len(batch) for batch in reports.stream_batches(conn, sql, schema)] == [0]
+
+    sql, schema = reports.union_query(conn, 'orders')  # Missing everywhere
+    assert sql == ''
+    batches = list(reports.stream_batches(conn, sql, schema))
+    assert len(batches) == 1 and len(batches[0]) == 0 and batches[0].schema == schema
+
+
+def test_grouped_sums_merges_partials(tmp_path):
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'product_id': rng.choice(['a', 'b', 'c', 'd'], 1000).astype(object),
+                          'price': rng.uniform(1, 100, 1000)})
+    batches = [pa.RecordBatch.from_pandas(frame[start:start + 64], preserve_index=False)
+               for start in range(0, len(frame), 64)]
+
+    sums = reports.grouped_sums(batches, ['product_id'], ['price'], compact_rows=5).to_pandas()
+    expected = frame.groupby('product_id')['price'].agg(['size', 'sum'])
+    sums = sums.set_index('product_id').loc[expected.index]
+    assert sums['rows'].tolist() == expected['size'].tolist()
+    np.testing.assert_allclose(sums['price'], expected['sum'])
+
+
+def test_top_wishlisted_joins_the_catalog(tmp_path):
+    conn = make_databases(tmp_path)
+    catalog = pa.table({'Product Id': ['15970', '39386'], 'Name': ['Shirt', 'Jeans']})
+    report = reports.top_wishlisted(conn, catalog, limit=5).to_pylist()
+    assert [(row['product_id'], row['wishlists'], row['Name']) for row in report] == [
+        ('15970', 2, 'Shirt'), ('39386', 2, 'Jeans')]
@@ -0,0 +1,175 @@
+"""Per-user rate limiting and coalescing of identical concurrent requests.
+
+RateLimiter keeps one token bucket per user: each expensive action takes a
+token, and tokens refill at a fixed rate up to a burst size. SingleFlight
+makes concurrent calls with the same key share one execution: the first
+caller runs the function and the others wait for its result (or
+exception). Both count what they did, so the Account page can show how
+much work was refused or deduplicated.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+RATE_PER_SECOND = 0.5  # Sustained expensive actions per user
+BURST = 5              # Actions a user can take back to back
+IDLE_BUCKETS = 10000   # Buckets kept before full (idle) ones are dropped
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost, now):
+        self.refill(now)
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+    def wait_time(self, cost):
+        """Seconds until `cost` tokens are available."""
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    def __init__(self, rate=RATE_PER_SECOND, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.counts = defaultdict(Counter)  # action -> {'allowed': n, 'limited': n}
+
+    def allow(self, user, action, cost=1):
+        """Take `cost` tokens from the user's bucket. Returns False when it is empty."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(user)
+            if bucket is None:
+                if len(self._buckets) >= IDLE_BUCKETS:
+                    self._drop_full(now)
+                bucket = self._buckets[user] = TokenBucket(self.rate, self.burst)
+            allowed = bucket.take(cost, now)
+            self.counts[action]['allowed' if allowed else 'limited'] += 1
+        return allowed
+
+    def retry_after(self, user, cost=1):
+        with self._lock:
+            bucket = self._buckets.get(user)
+            if bucket is None:
+                return 0.0
+            bucket.refill(time.monotonic())
+            return bucket.wait_time(cost)
+
+    def _drop_full(self, now):
+        # A full bucket is the same as no bucket
+        for user, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[user]
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counts = defaultdict(Counter)  # name -> {'calls': n, 'executed': n, 'shared': n}
+
+    def do(self, name, key, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), sharing the execution with concurrent calls for (name, key)."""
+        with self._lock:
+            self.counts[name]['calls'] += 1
+            call = self._calls.get((name, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(name, key)] = _Call()
+                self.counts[name]['executed'] += 1
+            else:
+                self.counts[name]['shared'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(name, key)]
+            call.done.set()
+        return call.result
+
+
+def stats(flight_counts, limit_counts):
+    """Per entry point: calls, computations actually run, calls that shared one, and rate-limited calls.
+
+    Takes the `counts` of a SingleFlight and a RateLimiter, which may live
+    in different processes.
+    """
+    rows = []
+    for name in sorted(set(flight_counts) | set(limit_counts)):
+        flights, limits = Counter(flight_counts.get(name, {})), Counter(limit_counts.get(name, {}))
+        rows.append({
+            'entry point': name,
+            'calls': flights['calls'],
+            'executed': flights['executed'],
+            'shared': flights['shared'],
+            'deduplicated %': round(100 * flights['shared'] / flights['calls'], 1) if flights['calls'] else 0.0,
+            'rate limited': limits['limited'],
+        })
+    return rows
+
+
+if __name__ == '__main__':
+    # Many concurrent identical requests against a slow computation
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Show the work saved by request coalescing.")
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--keys', type=int, default=10, help="Distinct requests")
+    parser.add_argument('--work-ms', type=float, default=50.0, help="Duration of one computation")
+    args = parser.parse_args()
+
+    flight = SingleFlight()
+
+    def slow(key):
+        time.sleep(args.work_ms / 1000)
+        return key
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(lambda i: flight.do('bench', i % args.keys, slow, i % args.keys), range(args.requests)))
+    elapsed = time.perf_counter() - started
+    counts = flight.counts['bench']
+    print(f"{args.requests} requests over {args.keys} keys on {args.threads} threads in {elapsed:.2f} s")
+    print(f"  computations run {counts['executed']}, shared {counts['shared']} "
+          f"({100 * counts['shared'] / counts['calls']:.1f}% deduplicated)")
+
+    limiter = RateLimiter()
+    allowed = sum(limiter.allow('user', 'bench') for _ in range(100))
+    print(f"  100 back-to-back actions by one user: {allowed} allowed, {100 - allowed} rate limited")